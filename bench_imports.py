@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark for the portfolio_cli subcommands.
+
+Each subcommand's modules are imported in a fresh interpreter, several times,
+and the best time is reported along with any heavy modules that came along.
+The text-only gains path must stay under the budget; the script exits 1 when
+it does not.
+
+    python bench_imports.py [--repeat 5] [--budget 0.5]
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+from portfolio_cli import COMMAND_MODULES
+
+
+HEAVY_MODULES = ['pandas', 'matplotlib', 'pdfplumber', 'yfinance']
+DEFAULT_BUDGET_SECONDS = 0.5
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import portfolio_cli
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def time_imports(modules, repeat):
+    """(best seconds, heavy modules loaded) over repeat fresh interpreters."""
+    best, heavy = None, []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', PROBE.format(modules=modules, heavy=HEAVY_MODULES)],
+                             capture_output=True, text=True, check=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        if best is None or result['seconds'] < best:
+            best = result['seconds']
+        heavy = result['heavy']
+    return best, heavy
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure import time of each portfolio_cli subcommand')
+    parser.add_argument('--repeat', type=int, default=5, help='Fresh interpreters per subcommand')
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET_SECONDS,
+                        help='Maximum import seconds for the gains command')
+    args = parser.parse_args(argv)
+
+    failed = False
+    for command, modules in COMMAND_MODULES.items():
+        seconds, heavy = time_imports(modules, args.repeat)
+        note = f"  loads {', '.join(heavy)}" if heavy else ''
+        print(f'{command:12s} {seconds * 1000:8.1f} ms{note}')
+        if command == 'gains' and (seconds > args.budget or heavy):
+            failed = True
+    if failed:
+        print(f'gains import exceeds {args.budget:.2f}s or loads heavy modules')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Scaling benchmark for the parsing, valuation and worm pipeline.
+
+For every portfolio size (--lots) and price-history length (--years) a
+scratch directory gets a ticker store of price_provider.SyntheticProvider
+histories (the offline pipeline's price source) and synthetic exports in
+each supported layout (E*TRADE os/ssr, Sellable, Chase, Fidelity), with the
+lots spread evenly over them, plus the page text of a Fidelity statement and
+of a 1099-B holding the same lots. Each stage is then timed (best of
+--repeat, warm ticker cache) and run once more under tracemalloc for its
+peak memory.
+
+Results go to --output as JSON. --compare reads an earlier output as the
+baseline and exits 1 when a stage got slower, or bigger, by more than
+--tolerance.
+
+    python bench_pipeline.py [--lots 10 1000 100000] [--years 1 30] [--output bench.json]
+    python bench_pipeline.py --compare baseline.json
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime
+
+import numpy as np
+import pandas  # noqa: F401  worm_dates() needs it; imported here so no stage is charged for it
+
+from export_schemas import EPOCH_ORDINAL
+from holdings import summarize_holdings
+from parse_1099b import parse_1099b_text
+from pdf_to_csv import parse_lot_text
+from portfolio import Portfolio
+from price_provider import SyntheticProvider
+from returns import money_weighted_returns
+from splits import SplitIndex
+import ticker_store
+
+
+DEFAULT_LOTS = [10, 1000, 100000]
+DEFAULT_YEARS = [1, 30]
+
+# Last day of every synthetic history; lots are valued here
+END_DATE = '06/13/2025'
+
+# Changes smaller than these are noise, whatever the ratio
+MIN_SECONDS_CHANGE = 0.01
+MIN_BYTES_CHANGE = 1 << 20
+
+LAYOUTS = ['etrade_os', 'etrade_ssr', 'sellable', 'chase', 'fidelity']
+
+ETRADE_OS_HEADER = ['Symbol', 'Qty #', 'Price Paid $', "Day's Gain $", 'Total Gain $', 'Total Gain %', 'Value $',
+                    'Date Acquired']
+ETRADE_SSR_HEADER = ['Symbol', 'Last Price $', 'Qty #', 'Price Paid $', "Day's Gain $", 'Total Gain $',
+                     'Total Gain %', 'Value $', 'Date Acquired']
+SELLABLE_HEADER = ['Symbol', 'Acquisition Date', 'Sellable Qty.', 'Est. Market Value', 'Expected Gain/Loss',
+                   'Total Gain %']
+CHASE_HEADER = ['Ticker', 'Acquired', 'Quantity', 'Unit Cost', 'Value', 'Unrealized G/L Amt.',
+                'Unrealized Gain/Loss (%)']
+FIDELITY_HEADER = ['Account', 'Symbol', 'Acquired', 'Term', 'Quantity', 'Average Cost Basis', 'Current Value',
+                   'Total Gain $', 'Total Gain %']
+
+
+# -----------------------------
+# Synthetic data
+# -----------------------------
+def synthetic_symbols(n):
+    """AAPL (the worm tracks it separately) followed by made-up four-letter tickers."""
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    names = ['AAPL']
+    for i in range(n - 1):
+        names.append('Z' + letters[i // 676 % 26] + letters[i // 26 % 26] + letters[i % 26])
+    return names
+
+
+def write_histories(directory, symbols, years, provider):
+    """
+    The provider's closes for every symbol over the years up to END_DATE,
+    saved as a ticker store in directory. Returns the days.
+    """
+    end = ticker_store.iso_to_day(datetime.strptime(END_DATE, '%m/%d/%Y').strftime('%Y-%m-%d'))
+    start = ticker_store.day_to_iso(end - int(years * 365.25))
+    for symbol in symbols:
+        series = ticker_store.PriceSeries.from_dict(provider.history(symbol, start, ticker_store.day_to_iso(end + 1)))
+        ticker_store.save(symbol, series, directory)
+    return series.days
+
+
+def synthetic_lots(n, symbols, days, rng):
+    """Columns of n lots bought on days of the history before its last week."""
+    return {
+        'symbol': rng.choice(symbols, n),
+        'day': rng.choice(days[:-5], n),
+        'qty': np.round(rng.uniform(0.001, 50, n), 3),
+        'paid': np.round(rng.uniform(1, 500, n), 2),
+        'value': np.round(rng.uniform(1, 20000, n), 2),
+    }
+
+
+def us_date(day, alternate=False):
+    d = date.fromordinal(int(day) + EPOCH_ORDINAL)
+    return d.strftime('%d-%b-%Y') if alternate else d.strftime('%m/%d/%Y')
+
+
+def write_export(path, layout, lots, rows, rng):
+    """Write the lots at rows in one export layout."""
+    with open(path, 'w', newline='') as fd:
+        writer = csv.writer(fd)
+        if layout.startswith('etrade'):
+            ssr = layout == 'etrade_ssr'
+            writer.writerows([['Account Summary'], ['Generated at Jun 13 2025 04:00 PM ET'], []])
+            header = ETRADE_SSR_HEADER if ssr else ETRADE_OS_HEADER
+            writer.writerow(header)
+            for symbol in np.unique(lots['symbol'][rows]):
+                writer.writerow([symbol] + [''] * (len(header) - 1))
+                for i in rows[lots['symbol'][rows] == symbol]:
+                    acquired = us_date(lots['day'][i])
+                    gain = round(lots['value'][i] - lots['qty'][i] * lots['paid'][i], 2)
+                    writer.writerow([acquired] + (['1.0'] if ssr else []) +
+                                    [lots['qty'][i], lots['paid'][i], 1.5, gain, 12.5, lots['value'][i], acquired])
+            writer.writerow(['CASH', '', '', '', '', '', '1,234.50'])
+        elif layout == 'fidelity':
+            writer.writerow(FIDELITY_HEADER)
+            for i in rows:
+                writer.writerow(['BrokerageLink', lots['symbol'][i], us_date(lots['day'][i]), 'Long', lots['qty'][i],
+                                 lots['paid'][i], lots['value'][i], 12.5, 4.5])
+        else:
+            chase = layout == 'chase'
+            writer.writerow(CHASE_HEADER if chase else SELLABLE_HEADER)
+            alternate = rng.random(len(rows)) < 0.3
+            for i, alt in zip(rows, alternate):
+                value = f"${lots['value'][i]:,.2f}"
+                if chase:
+                    writer.writerow([lots['symbol'][i], us_date(lots['day'][i], alt), lots['qty'][i],
+                                     lots['paid'][i], value, '$1,000.00', 5.5])
+                else:
+                    writer.writerow([lots['symbol'][i], us_date(lots['day'][i], alt), lots['qty'][i], value,
+                                     '$-12.00', 3.2])
+            writer.writerow(['Overall Total', '', '', '', '', '', ''])
+
+
+def fidelity_statement_text(lots, lines_per_page=40):
+    """Page texts of a Fidelity positions statement holding the lots."""
+    lines = []
+    for symbol in np.unique(lots['symbol']):
+        lines.append(symbol)
+        for i in np.flatnonzero(lots['symbol'] == symbol):
+            acquired = date.fromordinal(int(lots['day'][i]) + EPOCH_ORDINAL).strftime('%b-%d-%Y')
+            cost = lots['qty'][i] * lots['paid'][i]
+            gain = lots['value'][i] - cost
+            sign = '+' if gain >= 0 else '-'
+            lines.append(f"{acquired} Long {sign}${abs(gain):,.2f} +12.50% ${lots['value'][i]:,.2f} "
+                         f"{lots['qty'][i]:.3f} ${lots['paid'][i]:,.2f} ${cost:,.2f}")
+    return ['\n'.join(lines[i:i + lines_per_page]) for i in range(0, len(lines), lines_per_page)]
+
+
+def form_1099b_text(lots, lines_per_page=40):
+    """Page texts of a Morgan Stanley style 1099-B selling every lot on END_DATE."""
+    sold = datetime.strptime(END_DATE, '%m/%d/%Y').strftime('%m/%d/%y')
+    lines = []
+    for symbol in np.unique(lots['symbol']):
+        lines.append(f'{symbol} HOLDINGS INC CUSIP: 000000000 Symbol: {symbol}')
+        for i in np.flatnonzero(lots['symbol'] == symbol):
+            acquired = date.fromordinal(int(lots['day'][i]) + EPOCH_ORDINAL).strftime('%m/%d/%y')
+            cost = lots['qty'][i] * lots['paid'][i]
+            gain = lots['value'][i] - cost
+            gain = f'{gain:,.2f}' if gain >= 0 else f'({-gain:,.2f})'
+            lines.append(f"{lots['qty'][i]:.3f} {acquired} {sold} ${lots['value'][i]:,.2f} ${cost:,.2f} "
+                         f"0.00 0.00 {gain} 0.00")
+    return ['\n'.join(lines[i:i + lines_per_page]) for i in range(0, len(lines), lines_per_page)]
+
+
+# -----------------------------
+# Stages
+# -----------------------------
+class Scenario:
+    """Synthetic inputs of one (lots, years) run, written under directory."""
+
+    def __init__(self, directory, n_lots, years, seed=0):
+        rng = np.random.default_rng(seed)
+        self.n_lots = n_lots
+        self.years = years
+        self.ticker_dir = os.path.join(directory, 'ticker_data')
+        os.makedirs(self.ticker_dir)
+        self.symbols = synthetic_symbols(max(1, min(500, n_lots // 20)))
+        self.days = write_histories(self.ticker_dir, self.symbols, years, SyntheticProvider(seed))
+        lots = synthetic_lots(n_lots, self.symbols, self.days, rng)
+
+        self.paths = []
+        for layout, rows in zip(LAYOUTS, np.array_split(np.arange(n_lots), len(LAYOUTS))):
+            if len(rows):
+                path = os.path.join(directory, f'{layout}.csv')
+                write_export(path, layout, lots, rows, rng)
+                self.paths.append(path)
+        self.statement_pages = fidelity_statement_text(lots)
+        self.form_pages = form_1099b_text(lots)
+
+        # Later stages start from a parse done here, outside the timings
+        self.port = Portfolio(ticker_dir=self.ticker_dir)
+        for path in self.paths:
+            self.port.add_lots(self.port.parse_csv(path, END_DATE, fetch_AAPL_price=False)[0])
+        self.current_day = int(self.days[-1])
+        self.start_date = us_date(self.days[0])
+
+
+def stage_parse_csv(s):
+    port = Portfolio(ticker_dir=s.ticker_dir)
+    for path in s.paths:
+        port.parse_csv(path, END_DATE, fetch_AAPL_price=False)
+
+
+def stage_split_adjust(s):
+    index = SplitIndex({symbol: [(int(s.days[len(s.days) // 2]), 2.0)] for symbol in s.symbols})
+    index.adjust(s.port.lots.copy(), s.days[0], s.current_day)
+
+
+def stage_summarize(s):
+    summarize_holdings(s.port, s.port.lots, END_DATE)
+
+
+def stage_xirr(s):
+    lots = s.port.lots
+    money_weighted_returns(lots, lots.value, s.current_day)
+
+
+def stage_worm(s):
+    """generate_worm_single() without the plot or the worm cache."""
+    dates = s.port.worm_dates(s.start_date, END_DATE, 'daily')
+    s.port.compute_worm(None, ticker_store.to_days(dates))
+
+
+def stage_pdf_lots(s):
+    parse_lot_text(s.statement_pages)
+
+
+def stage_1099b(s):
+    parse_1099b_text(s.form_pages)
+
+
+STAGES = {
+    'parse_csv': stage_parse_csv,
+    'split_adjust': stage_split_adjust,
+    'summarize': stage_summarize,
+    'xirr': stage_xirr,
+    'worm': stage_worm,
+    'pdf_lots': stage_pdf_lots,
+    '1099b': stage_1099b,
+}
+
+
+def measure(func, scenario, repeat):
+    """(best seconds of repeat runs, peak traced bytes of one more run)."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(scenario)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    try:
+        func(scenario)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+# -----------------------------
+# Results
+# -----------------------------
+def result_key(result):
+    return result['stage'], result['lots'], result['years']
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Rows of (key, what, old, new) for stages slower or bigger than baseline beyond tolerance."""
+    old = {result_key(r): r for r in baseline['results'] if 'seconds' in r}
+    regressions = []
+    for result in results:
+        before = old.get(result_key(result))
+        if before is None or 'seconds' not in result:
+            continue
+        if (result['seconds'] > before['seconds'] * (1 + tolerance) and
+                result['seconds'] - before['seconds'] > MIN_SECONDS_CHANGE):
+            regressions.append((result_key(result), 'seconds', before['seconds'], result['seconds']))
+        if (result['peak_bytes'] > before['peak_bytes'] * (1 + tolerance) and
+                result['peak_bytes'] - before['peak_bytes'] > MIN_BYTES_CHANGE):
+            regressions.append((result_key(result), 'peak_bytes', before['peak_bytes'], result['peak_bytes']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the portfolio pipeline stages on synthetic portfolios')
+    parser.add_argument('--lots', type=int, nargs='+', default=DEFAULT_LOTS, help='Portfolio sizes in lots')
+    parser.add_argument('--years', type=int, nargs='+', default=DEFAULT_YEARS, help='Price history lengths')
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per stage; the best is kept')
+    parser.add_argument('--output', default='bench_pipeline.json', help='Where to write the results')
+    parser.add_argument('--compare', metavar='BASELINE', help='Earlier output to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed relative slowdown or memory growth against the baseline')
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fd:
+            baseline = json.load(fd)
+
+    results = []
+    for years in args.years:
+        for n_lots in args.lots:
+            with tempfile.TemporaryDirectory(prefix='bench_pipeline_') as directory:
+                scenario = Scenario(directory, n_lots, years)
+                for stage in args.stages:
+                    result = {'stage': stage, 'lots': n_lots, 'years': years}
+                    result['seconds'], result['peak_bytes'] = measure(STAGES[stage], scenario, args.repeat)
+                    print(f"{stage:12s} {n_lots:>7d} lots {years:>3d}y {result['seconds'] * 1000:10.1f} ms "
+                          f"{result['peak_bytes'] / (1 << 20):9.1f} MiB")
+                    results.append(result)
+
+    with open(args.output, 'w') as fd:
+        json.dump({'environment': environment(), 'results': results}, fd, indent=2)
+    print(f'Results written to {args.output}')
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for (stage, n_lots, years), what, before, after in regressions:
+            print(f'REGRESSION {stage} {n_lots} lots {years}y: {what} {before:.6g} -> {after:.6g} '
+                  f'({after / before - 1:+.0%})')
+        if regressions:
+            return 1
+        print(f'No regressions against {args.compare} (tolerance {args.tolerance:.0%})')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,45 +1,173 @@
-from portfolio import StockInfo, LotInfo, Portfolio, convert_date_format
+from portfolio import StockInfo, LotInfo, Portfolio, convert_date_format, MONEY_MARKET_FUNDS
 from datetime import datetime, timedelta
+import os
+import numpy as np
+import ingest
+import instrument
+from splits import SplitIndex, detect_rescaling
+import ticker_store
 
 
 
 port = Portfolio()
 
-def refresh_stock_data(PATHS, CURRENT_DATE=None):
-    for file_path in PATHS:
-        lots, _ = port.parse_csv(file_path, CURRENT_DATE, fetch_AAPL_price=False)
+# Closes cached and re-downloaded for the same day must agree to this relative
+# tolerance, otherwise yfinance has re-adjusted the history (split/dividend).
+ADJUSTMENT_TOLERANCE = 1e-6
+
+
+def latest_trading_day(today=None):
+    """Most recent weekday on or before today, as days since the epoch."""
+    today = today or datetime.today()
+    if today.weekday() >= 5:
+        today -= timedelta(days=today.weekday() - 4)
+    return ticker_store.iso_to_day(today.strftime('%Y-%m-%d'))
+
+
+def history_was_adjusted(series, history):
+    """True if a re-downloaded close disagrees with the cached one for the same day."""
+    for date, close in history.items():
+        if date in series:
+            cached = series[date]
+            if abs(close - cached) > ADJUSTMENT_TOLERANCE * max(abs(cached), 1.0):
+                return True
+    return False
+
+
+def plan_refresh(port, sym, required_day, latest_day, incremental=True, today_day=None):
+    """
+    Decide how much of a symbol's history to download: 'current' (nothing),
+    'tail' (from the returned start date) or 'full'. A history ending on
+    today_day gets a tail anyway, since its close may have been taken
+    intraday.
+    """
+    if not incremental:
+        return 'full', None
+    port.cache_ticker_data(sym)
+    series = port.ticker_cache.get(sym)
+    if series is None or len(series) < 2 or series.days[0] > required_day:
+        return 'full', None
+    if series.days[-1] >= latest_day and series.days[-1] != today_day:
+        return 'current', None
+    # Re-download from the second-to-last cached day: its close is final, so a
+    # mismatch there means the whole history was re-adjusted. The last cached
+    # close may have been taken intraday and is overwritten.
+    return 'tail', ticker_store.day_to_iso(series.days[-2])
+
+
+def append_tail(port, sym, history):
+    """Merge a downloaded tail into the cache. Returns 'current', 'appended' or 'full' (re-adjusted)."""
+    series = port.ticker_cache[sym]
+    last_date = ticker_store.day_to_iso(series.days[-1])
+    # The last cached close may have been taken intraday, so it is not compared
+    if history_was_adjusted(series, {date: close for date, close in history.items() if date != last_date}):
+        return 'full'
+    if not any(date > last_date for date in history) and history.get(last_date, series[last_date]) == series[last_date]:
+        # Nothing newer to add (delisted, or only a market holiday since)
+        return 'current'
+    port.merge_history(sym, history)
+    return 'appended'
+
+
+def refresh_symbols(port, symbols, start_date, required_days=None, incremental=True):
+    """
+    Bring the cached history of symbols up to date and write back the ones
+    that changed. required_days maps a symbol to the first day (epoch days) it
+    must have a price for; a cache starting later is downloaded in full from
+    start_date ('YYYY-MM-DD').
+    """
+    if port.provider.synthetic and os.path.abspath(port.ticker_dir) != os.path.abspath(port.provider.store_dir):
+        raise ValueError(f'Refusing to write synthetic prices into {port.ticker_dir}; '
+                         f'they belong in {port.provider.store_dir}')
+    required_days = required_days or {}
+    today = datetime.today()
+    end_date = (today + timedelta(days=7)).strftime('%Y-%m-%d')
+    latest_day = latest_trading_day(today)
+    today_day = ticker_store.iso_to_day(today.strftime('%Y-%m-%d'))
+
+    outcomes = {}
+    plans = {}
+    for sym in sorted(symbols):
+        required_day = required_days.get(sym)
+        if required_day is None:
+            required_day = latest_day
+        plans[sym] = plan_refresh(port, sym, required_day, latest_day, incremental, today_day)
+
+    # Tails first; any symbol whose history turns out re-adjusted joins the
+    # full downloads. Each batch is fetched concurrently; symbols that fail
+    # are reported by the provider and left as they are.
+    tail_jobs = {sym: (start, end_date) for sym, (plan, start) in plans.items() if plan == 'tail'}
+    histories = port.download_histories(tail_jobs)
+    for sym, history in histories.items():
+        outcomes[sym] = append_tail(port, sym, history)
+    for sym, (plan, _) in plans.items():
+        if plan == 'current':
+            outcomes[sym] = 'current'
+
+    full_jobs = {sym: (start_date, end_date) for sym, (plan, _) in plans.items() if plan == 'full'}
+    full_jobs.update({sym: (start_date, end_date) for sym, outcome in outcomes.items() if outcome == 'full'})
+    histories = port.download_histories(full_jobs)
+    split_index = SplitIndex()
+    for sym, history in sorted(histories.items()):
+        if not history:
+            print(f'Error fetching {sym}: no price history returned for {start_date} to {end_date}')
+            outcomes.pop(sym, None)
+            continue
+        if sym not in port.ticker_cache:
+            port.cache_ticker_data(sym)
+        old = port.ticker_cache.get(sym)
+        port.merge_history(sym, history, replace=True)
+        outcomes[sym] = 'full'
+        if old is not None:
+            # A rescaled history is how a new split shows up; it is only reported
+            new = port.ticker_cache[sym]
+            for day, ratio in split_index.unlisted(sym, detect_rescaling(old.days, old.closes, new.days, new.closes)):
+                print(f"  ⚠ {sym} history rescaled {ratio:g}:1 on {ticker_store.day_to_iso(day)}; "
+                      f"if that was a split, add it to STOCK_SPLITS in config.py")
+
+    for outcome in outcomes.values():
+        instrument.count(f'refresh.{outcome}')
+    changed = [sym for sym, outcome in outcomes.items() if outcome != 'current']
+    port.write_ticker_cache(changed)
+    full = sum(1 for outcome in outcomes.values() if outcome == 'full')
+    print(f"Cache refresh complete: {len(changed)} updated ({full} full downloads), "
+          f"{len(outcomes) - len(changed)} already current.")
+    return outcomes
+
+
+@instrument.span('refresh_stock_data')
+def refresh_stock_data(PATHS, CURRENT_DATE=None, incremental=True):
+    for lots, _ in ingest.parse_exports(PATHS, CURRENT_DATE, fetch_AAPL_price=False, priced=False).values():
         port.add_lots(lots)
 
-    symbols = set(['GLD', 'VGT', 'VTI', 'VOO', 'SPY', 'QQQ', '^IXIC', '^GSPC', '^DJI'])
-    for l in port.lots:
-        symbols.add(l.symbol)
+    index_symbols = set(['GLD', 'VGT', 'VTI', 'VOO', 'SPY', 'QQQ', '^IXIC', '^GSPC', '^DJI'])
+    # Money market funds are always priced at $1.00
+    held = [sym for sym in port.lots.held_symbols() if sym not in MONEY_MARKET_FUNDS]
+    symbols = set(index_symbols) | set(held)
 
-    # Find the earliest lot date to determine cache start date
+    # Find the earliest lot date to determine cache start date, and the first
+    # day each symbol needs a price for
+    first_day = np.full(len(port.lots.symbols), np.iinfo(np.int32).max, dtype=np.int32)
+    np.minimum.at(first_day, port.lots.symbol_code, port.lots.day)
+    first_lot_day = {sym: int(first_day[port.lots.code(sym)]) for sym in port.lots.held_symbols()}
     earliest_date = datetime.strptime('2015-01-01', '%Y-%m-%d')
-    for lot in port.lots:
-        try:
-            lot_date = datetime.strptime(lot.date, '%m/%d/%Y')
-            if lot_date < earliest_date:
-                earliest_date = lot_date
-        except:
-            continue
+    if len(port.lots):
+        earliest_date = min(earliest_date, datetime.strptime(ticker_store.day_to_iso(port.lots.day.min()), '%Y-%m-%d'))
+    earliest_lot_day = min(first_lot_day.values(), default=None)
+
+    # Index symbols are priced at every lot's purchase date
+    required_days = dict(first_lot_day)
+    if earliest_lot_day is not None:
+        required_days.update({sym: earliest_lot_day for sym in index_symbols})
 
     # Fetch data from earliest lot date (minus 30 days buffer) through today + 7 days
     start_date = (earliest_date - timedelta(days=30)).strftime('%Y-%m-%d')
-    today = datetime.today()
-    end_date = (today + timedelta(days=7)).strftime('%m/%d/%Y')
-
-    print(f"Refreshing cache: {start_date} to {end_date} for {len(symbols)} symbols...")
 
-    for sym in symbols:
-        try:
-            port.get_stock_price(sym, start_date, itr=5, end_date=end_date)
-        except Exception as e:
-            print(f'Error fetching {sym}: {e}')
+    print(f"Refreshing cache: from {start_date} for {len(symbols)} symbols...")
 
-    port.write_ticker_cache()
-    print(f"Cache refresh complete.")
+    refresh_symbols(port, symbols, start_date, required_days, incremental)
 
 
 if __name__ == '__main__':
-    refresh_stock_data()
+    from gains import PATHS
+    refresh_stock_data(PATHS)
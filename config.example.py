@@ -3,3 +3,16 @@
 
 # Bank cash constant (not tracked in portfolio files)
 BANK_CASH = 0.0  # Replace with your actual bank cash amount
+
+# Extra company name -> ticker entries for the 1099-B and Fidelity PDF parsers,
+# matched before the built-in names, e.g. {'COCA COLA': 'KO'}
+COMPANY_SYMBOLS = {}
+
+# Stock splits on top of the built-in ones in splits.py, applied to exports
+# taken before them: {symbol: [('YYYY-MM-DD', ratio), ...]}, e.g. {'NVDA': [('2024-06-10', 10.0)]}
+STOCK_SPLITS = {}
+
+# Dates of exports that do not carry one (Chase, Sellable, some Fidelity
+# downloads), needed to adjust them for later splits:
+# {file path or file name: 'MM/DD/YYYY'}, e.g. {'chase_os_dec03.csv': '12/03/2025'}
+EXPORT_DATES = {}
@@ -0,0 +1,61 @@
+"""
+Small on-disk cache for derived data.
+
+Each entry is pickled to its own file under .cache/<name>/ and tagged with a
+version string; bumping the version (e.g. when a parser changes) invalidates
+every entry written by the old code.
+"""
+import hashlib
+import os
+import pickle
+
+import instrument
+
+
+CACHE_DIR = '.cache'
+
+
+def content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fd:
+        for chunk in iter(lambda: fd.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_stat(path):
+    """(mtime in ns, size in bytes): a cheap check before hashing the content."""
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+class DiskCache:
+    def __init__(self, name, version, directory=CACHE_DIR):
+        self.name = name
+        self.directory = os.path.join(directory, name)
+        self.version = version
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode()).hexdigest() + '.pkl')
+
+    def get(self, key):
+        """The stored value for key, or None if missing, unreadable or from another version."""
+        try:
+            with open(self._path(key), 'rb') as fd:
+                version, stored_key, value = pickle.load(fd)
+        except Exception:
+            instrument.count(f'cache.{self.name}.miss')
+            return None
+        if version != self.version or stored_key != key:
+            instrument.count(f'cache.{self.name}.miss')
+            return None
+        instrument.count(f'cache.{self.name}.hit')
+        return value
+
+    def put(self, key, value):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as fd:
+            pickle.dump((self.version, key, value), fd, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
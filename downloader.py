@@ -0,0 +1,57 @@
+"""
+Concurrent bulk download of daily close histories.
+
+download_histories() fans per-symbol requests out over a bounded thread pool
+with per-symbol retries, so refreshing dozens of tickers costs roughly as long
+as the slowest single request. Requests go to a price_provider.PriceProvider,
+so the same code runs offline against StoreProvider or SyntheticProvider.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import instrument
+
+
+MAX_WORKERS = 8
+RETRIES = 3
+BACKOFF_SECONDS = 0.5
+
+
+def fetch_with_retries(provider, symbol, start, end, retries=RETRIES, backoff=BACKOFF_SECONDS):
+    """Call provider.history(), retrying with exponential backoff. Re-raises the last error."""
+    for attempt in range(retries):
+        instrument.count('network.requests')
+        try:
+            return provider.history(symbol, start, end)
+        except Exception:
+            if attempt == retries - 1:
+                instrument.count('network.failures')
+                raise
+            instrument.count('network.retries')
+            time.sleep(backoff * 2 ** attempt)
+
+
+def download_histories(jobs, provider, max_workers=MAX_WORKERS, retries=RETRIES, backoff=BACKOFF_SECONDS):
+    """
+    Download many symbols concurrently.
+
+    jobs maps symbol -> (start, end) as 'YYYY-MM-DD' strings, end exclusive.
+    Returns (histories, errors): {symbol: {'YYYY-MM-DD': close}} for the
+    symbols that succeeded and {symbol: exception} for those that did not.
+    """
+    histories = {}
+    errors = {}
+    if not jobs:
+        return histories, errors
+
+    with instrument.span('download_histories'), ThreadPoolExecutor(max_workers=min(max_workers, len(jobs))) as pool:
+        futures = {
+            sym: pool.submit(fetch_with_retries, provider, sym, start, end, retries, backoff)
+            for sym, (start, end) in jobs.items()
+        }
+        for sym, future in futures.items():
+            try:
+                histories[sym] = future.result()
+            except Exception as e:
+                errors[sym] = e
+    return histories, errors
@@ -0,0 +1,40 @@
+"""
+Display-side downsampling of long curves.
+
+lttb_indices() implements Largest-Triangle-Three-Buckets: it keeps the first
+and last points and, from each bucket in between, the point that forms the
+largest triangle with the point kept before it and the mean of the next
+bucket. Peaks and troughs survive, so a multi-decade worm drawn from a few
+hundred points looks like the full-resolution one.
+"""
+import numpy as np
+
+
+def lttb_indices(x, y, threshold):
+    """Indices of at most threshold points of (x, y) to draw, in order."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # threshold - 2 buckets over the interior points, then the last point on its own
+    edges = np.append(np.linspace(1, n - 1, threshold - 1).astype(np.int64), n)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_x = x[hi:edges[i + 2]].mean()
+        next_ys = y[hi:edges[i + 2]]
+        next_y = y[a] if np.isnan(next_ys).all() else np.nanmean(next_ys)
+        area = np.abs((x[a] - next_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y - y[a]))
+        a = lo + int(np.argmax(np.where(np.isnan(area), -1.0, area)))
+        keep[i + 1] = a
+    return keep
+
+
+def lttb(x, y, threshold):
+    """(x, y) reduced to at most threshold points with lttb_indices()."""
+    keep = lttb_indices(x, y, threshold)
+    return np.asarray(x)[keep], np.asarray(y)[keep]
@@ -0,0 +1,169 @@
+"""
+Declarative layouts of the brokerage exports Portfolio.parse_csv reads.
+
+A file's layout is recognised from its header row, not its name. Each schema
+says where the header is, how the data ends, which date formats appear and
+how the cost basis is priced. Column positions come from
+portfolio.determine_header_map.
+"""
+import os
+import re
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Callable, Optional
+
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+US_DATE_RE = re.compile(r'^(\d{1,2})/(\d{1,2})/(\d{4})$')
+
+# When an export was taken, as the brokerages write it into the file
+AS_OF_PATTERNS = [
+    (re.compile(r'Generated at ([A-Z][a-z]{2} \d{1,2} \d{4})'), '%b %d %Y'),    # E*TRADE preamble
+    (re.compile(r'Date downloaded ([A-Z][a-z]{2}-\d{1,2}-\d{4})'), '%b-%d-%Y'),  # Fidelity footer
+    (re.compile(r'[Aa]s of:? (\d{1,2}/\d{1,2}/\d{4})'), '%m/%d/%Y'),
+]
+
+
+@dataclass(frozen=True)
+class ExportSchema:
+    name: str
+    # Does this row look like the header of this layout?
+    matches_header: Callable[[list], bool]
+    # Some exports have preamble rows above the header; others start with it
+    header_in_first_row: bool
+    # Row that ends the lot data (disclaimers, totals)
+    is_end_of_data: Callable[[list], bool]
+    # First cell of the row holding uninvested cash, which also ends the data
+    cash_row: Optional[str] = None
+    # Symbol on its own row above its lots, instead of a Symbol column
+    symbol_rows: bool = False
+    # price_paid is the cached close at acquisition rather than the file's figure
+    market_cost_basis: bool = False
+    # Acquisition date formats; the first is canonical and the others are converted to it
+    date_formats: tuple = ('%m/%d/%Y',)
+    # Rows for these symbols are not lots (e.g. cash sweep placeholders)
+    skip_symbols: frozenset = frozenset()
+
+
+def _cell(row, index):
+    return row[index].strip() if index < len(row) else ''
+
+
+def _has_columns(header, *alternatives):
+    """Every group in alternatives has at least one of its names in the header."""
+    names = {col.strip() for col in header}
+    return all(names & set(group) for group in alternatives)
+
+
+ETRADE = ExportSchema(
+    name='etrade',
+    matches_header=lambda row: (_cell(row, 0).startswith('Symbol') and
+                                (_cell(row, 1).startswith('Last Price $') or _cell(row, 1).startswith('Qty #'))),
+    header_in_first_row=False,
+    is_end_of_data=lambda row: False,
+    cash_row='CASH',
+    symbol_rows=True,
+)
+
+FIDELITY = ExportSchema(
+    name='fidelity',
+    matches_header=lambda row: _has_columns(row, ['Symbol'], ['Average Cost Basis'], ['Current Value']),
+    header_in_first_row=True,
+    is_end_of_data=lambda row: 'The data and information' in row[0],
+    market_cost_basis=True,
+    date_formats=('%m/%d/%Y', '%d-%b-%Y'),
+    skip_symbols=frozenset(['QAJDS']),
+)
+
+# Stock plan "Sellable" and Chase lot exports
+GRANT = ExportSchema(
+    name='grant',
+    matches_header=lambda row: _has_columns(row, ['Symbol', 'Ticker'], ['Quantity', 'Sellable Qty.'],
+                                            ['Date Acquired', 'Acquisition Date', 'Acquired']),
+    header_in_first_row=True,
+    is_end_of_data=lambda row: row[0].startswith('Overall Total'),
+    market_cost_basis=True,
+    date_formats=('%m/%d/%Y', '%d-%b-%Y'),
+    # this represents cash in chase
+    skip_symbols=frozenset(['QAJDS']),
+)
+
+SCHEMAS = [ETRADE, FIDELITY, GRANT]
+
+
+def schema_named(name):
+    for schema in SCHEMAS:
+        if schema.name == name:
+            return schema
+    raise ValueError(f'Unknown export layout: {name}')
+
+
+def detect_schema(reader, file_path=''):
+    """
+    Consume rows from a csv reader up to and including the header.
+    Returns (schema, header row).
+    """
+    for i, row in enumerate(reader):
+        for schema in SCHEMAS:
+            if schema.header_in_first_row and i > 0:
+                continue
+            if row and schema.matches_header(row):
+                return schema, row
+    raise ValueError(f'Unrecognized export layout: {file_path}')
+
+
+def parse_date(text, formats=('%m/%d/%Y',)):
+    """
+    Parse an acquisition date in any of formats. Returns ('MM/DD/YYYY' text,
+    days since the epoch), or None if it is not a date. Canonical dates keep
+    their text as written.
+    """
+    match = US_DATE_RE.match(text)
+    if match and formats[0] == '%m/%d/%Y':
+        month, day, year = (int(part) for part in match.groups())
+        try:
+            return text, date(year, month, day).toordinal() - EPOCH_ORDINAL
+        except ValueError:
+            return None
+    for fmt in formats[1:]:
+        try:
+            parsed = datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        return parsed.strftime('%m/%d/%Y'), parsed.toordinal() - EPOCH_ORDINAL
+    return None
+
+
+def configured_export_dates():
+    """EXPORT_DATES from config.py: {file path or file name: 'MM/DD/YYYY'}."""
+    try:
+        from config import EXPORT_DATES
+    except ImportError:
+        EXPORT_DATES = {}
+    return EXPORT_DATES
+
+
+def export_as_of_day(file_path, export_dates=None):
+    """
+    Day (since the epoch) an export was taken: the date the brokerage wrote
+    into it, or else its entry in export_dates (default EXPORT_DATES in
+    config.py) by path or file name. None if neither has one.
+    """
+    try:
+        with open(file_path, 'r', encoding='utf-8-sig', errors='replace') as fd:
+            text = fd.read()
+        for pattern, fmt in AS_OF_PATTERNS:
+            match = pattern.search(text)
+            if match:
+                try:
+                    return datetime.strptime(match.group(1), fmt).toordinal() - EPOCH_ORDINAL
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    if export_dates is None:
+        export_dates = configured_export_dates()
+    configured = export_dates.get(file_path, export_dates.get(os.path.basename(file_path)))
+    if configured is None:
+        return None
+    return datetime.strptime(configured, '%m/%d/%Y').toordinal() - EPOCH_ORDINAL
@@ -3,10 +3,10 @@
 Fix AAPL cost basis by fetching actual stock prices on acquisition dates
 """
 import pandas as pd
-import yfinance as yf
 from datetime import datetime, timedelta
 import json
 from pathlib import Path
+import price_provider
 
 # Load ticker cache if available
 CACHE_FILE = Path('/Users/osman/github/portfolio_comp/ticker_cache.json')
@@ -15,6 +15,8 @@ if CACHE_FILE.exists():
     with open(CACHE_FILE, 'r') as f:
         ticker_cache = json.load(f)
 
+provider = price_provider.default_provider()
+
 def get_stock_price(symbol, date_str, cached=True):
     """Get stock price for a symbol on a specific date"""
     # Parse date (format: MM/DD/YYYY, MM/DD/YY, or YYYY-MM-DD)
@@ -46,28 +48,26 @@ def get_stock_price(symbol, date_str, cached=True):
                 print(f"  📅 Using {check_date} (market closed on {date_key})")
                 return ticker_cache[symbol][check_date]
 
-    # Fetch from yfinance if not cached
-    print(f"  🔍 Fetching {symbol} price for {date_key} from yfinance...")
+    # Fetch from the price provider if not cached
+    print(f"  🔍 Fetching {symbol} price for {date_key} from {type(provider).__name__}...")
     try:
         # Fetch a week of data around the target date
         start_date = (date - timedelta(days=7)).strftime('%Y-%m-%d')
         end_date = (date + timedelta(days=7)).strftime('%Y-%m-%d')
 
-        ticker = yf.Ticker(symbol)
-        hist = ticker.history(start=start_date, end=end_date)
+        hist = provider.history(symbol, start_date, end_date)
 
-        if hist.empty:
+        if not hist:
             print(f"  ❌ No data found for {symbol} around {date_key}")
             return None
 
         # Try to find exact date or closest date
-        hist.index = hist.index.strftime('%Y-%m-%d')
-        if date_key in hist.index:
-            price = hist.loc[date_key, 'Close']
+        if date_key in hist:
+            price = hist[date_key]
         else:
             # Get closest date
-            price = hist.iloc[0]['Close']
-            actual_date = hist.index[0]
+            actual_date = min(hist)
+            price = hist[actual_date]
             print(f"  📅 Using {actual_date} (closest to {date_key})")
 
         # Cache it
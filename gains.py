@@ -2,14 +2,17 @@ import csv
 import sys
 
 from dataclasses import dataclass
-from dateutil.parser import parse
-import yfinance as yf
 from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
 import json
-from portfolio import StockInfo, LotInfo, Portfolio, convert_date_format, MONEY_MARKET_FUNDS, YEARS_CUTOFF, calculate_cagr
+from portfolio import Portfolio, MONEY_MARKET_FUNDS, convert_date_format
 from cache_stocks import refresh_stock_data
-from pdf_to_csv import convert_to_csv
+from holdings import summarize_holdings
+from export_schemas import export_as_of_day
+import instrument
+from ingest import parse_exports
+from splits import SplitIndex
+from returns import annualized_twr, money_weighted_returns
+import ticker_store
 
 # Import bank cash from config file (gitignored)
 try:
@@ -19,47 +22,6 @@ except ImportError:
     BANK_CASH = 0.0
     print("Warning: config.py not found. Using BANK_CASH = 0.0")
 
-# Known stock splits: {symbol: [(date, ratio), ...]}
-# date format: 'YYYY-MM-DD', ratio is the split multiplier
-STOCK_SPLITS = {
-    'VGT': [('2026-04-21', 8.0)],  # 8:1 split on 04/21/2026
-}
-
-def adjust_for_splits(symbol, quantity, csv_date_str, current_date_str):
-    """
-    Adjust quantity for stock splits that occurred between csv_date and current_date.
-    csv_date_str should be in 'MM/DD/YYYY' or 'YYYY-MM-DD' format.
-    current_date_str should be in 'MM/DD/YYYY' format.
-    Returns the adjusted quantity.
-    """
-    if symbol not in STOCK_SPLITS:
-        return quantity
-
-    from datetime import datetime
-
-    # Parse CSV date (could be from file metadata, using a conservative old date)
-    # For chase files, we know they're from December 2025
-    try:
-        if '/' in csv_date_str:
-            csv_date = datetime.strptime(csv_date_str, '%m/%d/%Y')
-        else:
-            csv_date = datetime.strptime(csv_date_str, '%Y-%m-%d')
-    except:
-        # If we can't parse, assume it's old enough to need adjustment
-        csv_date = datetime(2020, 1, 1)
-
-    current_date = datetime.strptime(current_date_str, '%m/%d/%Y')
-
-    adjusted_qty = quantity
-    for split_date_str, split_ratio in STOCK_SPLITS[symbol]:
-        split_date = datetime.strptime(split_date_str, '%Y-%m-%d')
-        # If the split occurred between CSV date and current date, adjust quantity
-        if csv_date < split_date <= current_date:
-            adjusted_qty *= split_ratio
-            print(f"  ✓ Adjusted {symbol} for {split_ratio}:1 split on {split_date_str}: {quantity} → {adjusted_qty} shares")
-
-    return adjusted_qty
-
 def most_recent_working_day():
     today = datetime.today()
     # If today is Saturday (weekday() == 5), go back to Friday
@@ -128,88 +90,173 @@ PATHS = [
 
 ]
 
-port = Portfolio()
+# Fidelity 401(k) statements converted to CSV before each run: (pdf, csv, label)
+PDF_EXPORTS = [
+    ('/Users/osman/Downloads/401_os_mar3.pdf', '/Users/osman/Downloads/PortfolioDownload_os_fidelity.csv', '401_os_fidelity (PDF)'),
+    ('/Users/osman/Downloads/401_ssr_mar3.pdf', '/Users/osman/Downloads/PortfolioDownload_ssr_fidelity.csv', '401_ssr_fidelity (PDF)'),
+]
 
-if __name__ == '__main__':
 
-    total_value = 0.0
-    total_gain = 0.0
+@instrument.span('plot_holdings')
+def plot_holdings(symbols, values, gains, total_values, all_cagrs):
+    import matplotlib.pyplot as plt
 
-    # Convert PDFs to CSV and capture cash from money market funds
-    cash_from_pdf = {}
-    pdf_cash_os = convert_to_csv('/Users/osman/Downloads/401_os_mar3.pdf', '/Users/osman/Downloads/PortfolioDownload_os_fidelity.csv')
-    if pdf_cash_os:
-        cash_from_pdf['401_os_fidelity (PDF)'] = pdf_cash_os
+    # Create color lists for each chart (Cash bar will be green)
+    colors_blue = ['green' if sym == 'Cash' else 'blue' for sym in symbols]
+    colors_orange = ['green' if sym == 'Cash' else 'orange' for sym in symbols]
+    colors_purple = ['green' if sym == 'Cash' else 'purple' for sym in symbols]
 
-    pdf_cash_ssr = convert_to_csv('/Users/osman/Downloads/401_ssr_mar3.pdf', '/Users/osman/Downloads/PortfolioDownload_ssr_fidelity.csv')
-    if pdf_cash_ssr:
-        cash_from_pdf['401_ssr_fidelity (PDF)'] = pdf_cash_ssr
+    # Create a figure with 2 rows and 2 columns using gridspec
+    fig, axes = plt.subplots(2, 2, figsize=(14, 10), gridspec_kw={'height_ratios': [1, 1]})
 
-    CURRENT_DATE = most_recent_working_day()
+    # First plot: Percentage of total portfolio (top-left)
+    bars = axes[0, 0].bar(symbols, values, color=colors_blue)
+    axes[0, 0].set_title('Percentage of total portfolio')
+    # axes[0, 0].set_xlabel('Stock Symbol')
+    axes[0, 0].set_ylabel('Percentage (%)')
 
-    print(f'Analyzing portfolio as of {CURRENT_DATE}...')
-    refresh_stock_data(PATHS)
+    for bar in bars:
+        yval = bar.get_height()
+        axes[0, 0].text(bar.get_x() + bar.get_width() / 2, yval, f'{yval:.2f}', ha='center', va='bottom')
 
-    total_cash_from_csv = sum(cash_from_pdf.values())
-    cash_by_file = dict(cash_from_pdf)  # Start with PDF cash
+    # Second plot: Stock Gains (top-right)
+    gain_bars = axes[0, 1].bar(symbols, gains, color='green')
+    axes[0, 1].set_title('Stock Gains')
+    # axes[0, 1].set_xlabel('Stock Symbol')
+    axes[0, 1].set_ylabel('Gains')
+
+    for bar in gain_bars:
+        yval = bar.get_height()
+        axes[0, 1].text(bar.get_x() + bar.get_width() / 2, yval, f'{yval:,.0f}', ha='center', va='bottom')
+
+    # Third plot: Total Values (bottom, spanning both columns)
+    # Remove the extra axis in the second column
+    # fig.delaxes(axes[1, 0])
+    # fig.delaxes(axes[1, 1])
 
-    for file_path in PATHS:
-        lots, cash = port.parse_csv(file_path, CURRENT_DATE)
+    # Create a single plot spanning both columns
+    # total_bars = fig.add_subplot(2, 1, 2)  # This makes a single subplot spanning the second row
+    axes[1, 0].bar(symbols, total_values, color=colors_orange)
+    axes[1, 0].set_title('Total Values')
+    # axes[1, 0].set_xlabel('Stock Symbol')
+    axes[1, 0].set_ylabel('Total Value ($)')
 
-        # Adjust quantities for stock splits (for old CSV files)
-        # Determine CSV file date from filename or use a conservative date
-        csv_file_date = '12/03/2025' if 'dec03' in file_path.lower() else '01/01/2020'
-        if 'apr' in file_path.lower():
-            csv_file_date = '04/14/2026' if 'apr14' in file_path.lower() else '04/21/2026'
+    # Remove the default numeric x-axis labels and set the stock symbols
+    # total_bars.set_xticks(range(len(symbols)))  # Set positions of the symbols
+    # total_bars.set_xticklabels(symbols)  # Replace numbers with symbols
 
-        for lot in lots:
-            original_qty = lot.qty
-            lot.qty = adjust_for_splits(lot.symbol, lot.qty, csv_file_date, CURRENT_DATE)
+    for bar in axes[1, 0].patches:
+        yval = bar.get_height()
+        axes[1, 0].text(
+            bar.get_x() + bar.get_width() / 2,
+            yval,
+            f'{yval:,.0f}',  # 🔹 Format with thousands separator
+            ha='center',
+            va='bottom'
+        )
 
-            # Recalculate CAGR with adjusted quantity (split doesn't affect CAGR calculation)
-            # CAGR should be based on price appreciation, not quantity changes from splits
-            if lot.cagr and lot.qty != original_qty:
-                # CAGR remains the same - it's based on price returns, not quantity
-                # The quantity adjustment was just accounting for the split
-                pass  # lot.cagr stays the same
+    axes[1, 1].bar(symbols, all_cagrs, color=colors_purple)
+    axes[1, 1].set_title('CAGR')
+    # axes[1, 1].set_xlabel('Stock Symbol')
+    axes[1, 1].set_ylabel('CAGR (%)')
+
+    for bar in axes[1, 1].patches:
+        yval = bar.get_height()
+        axes[1, 1].text(bar.get_x() + bar.get_width() / 2, yval, f'{yval:,.0f}', ha='center', va='bottom')
+
+    # Adjust layout to minimize white space
+    plt.tight_layout()
+
+    plt.show()
+
+    # port.write_ticker_cache()
+    # port.generate_worm()
+    # port.plot_timeline()
+
+
+def add_exports(port, paths, exports, current_day):
+    """
+    Add the lots of parsed exports ({path: (LotTable, cash)}) to port, in the
+    order of paths: AAPL cost bases from the ticker cache, and quantities
+    scaled for the splits between each export's as-of day and current_day.
+    Returns [(file name, cash)] for the exports holding uninvested cash.
+    """
+    # Known and configured splits only (see splits.py)
+    split_index = SplitIndex()
+
+    cash_by_file = []
+    for file_path in paths:
+        lots, cash = exports[file_path]
+        # Lot values are re-priced at the valuation date later; only the AAPL
+        # cost basis needs the cached price at acquisition
+        port.use_market_cost_basis(lots)
+
+        # Quantities are as of the export; scale them for splits since then
+        as_of_day = export_as_of_day(file_path)
+        if as_of_day is None:
+            split = [symbol for symbol in lots.held_symbols() if split_index.splits(symbol, until=current_day)]
+            if split:
+                raise ValueError(f"{file_path}: no as-of date in the export, needed for the {', '.join(split)} "
+                                 f"split adjustment; add it to EXPORT_DATES in config.py")
+            as_of_day = current_day
+        factors = split_index.adjust(lots, as_of_day, current_day)
+        for lot, factor in zip(lots, factors):
+            if factor != 1.0:
+                for split_day, ratio in split_index.splits(lot.symbol, as_of_day, current_day):
+                    print(f"  ✓ Adjusted {lot.symbol} for {ratio}:1 split on {ticker_store.day_to_iso(split_day)}: "
+                          f"{lot.qty / factor} → {lot.qty} shares")
 
         port.add_lots(lots)
         if cash > 0:
-            file_name = file_path.split('/')[-1]
-            cash_by_file[file_name] = cash
-            total_cash_from_csv += cash
-        weighted_average_cagr = port.calculate_weighted_average_cagr()
-
-    for lot in port.lots:
-        if lot.symbol not in port.portfolio:
-            port.portfolio[lot.symbol] = StockInfo(lot.symbol)
-
-        port.portfolio[lot.symbol].qty += lot.qty
-        # port.portfolio[lot.symbol].value += lot.value
-        port.cache_ticker_data(lot.symbol)
-        lot_cost_price = port.get_stock_price(lot.symbol, convert_date_format(lot.date, input_format='%m/%d/%Y'), cached=True)
-        lot_current_price = port.get_stock_price(lot.symbol, convert_date_format(CURRENT_DATE, input_format='%m/%d/%Y'), cached=True)
-        port.portfolio[lot.symbol].value += lot.qty * lot_current_price
-        lot.value = lot.qty * lot_current_price
-
-        lot.total_gain = lot.value - lot.price_paid * lot.qty
-        port.portfolio[lot.symbol].gain += lot.value - lot.price_paid * lot.qty
-
-        # Recalculate CAGR with current prices (lot.cagr from CSV may be stale)
-        acquisition_date = parse(lot.date)
-        current_date = datetime.now()
-        years_held = (current_date - acquisition_date).days / 365.25
-
-        if years_held >= YEARS_CUTOFF and lot_cost_price > 0:
-            start_value = lot.qty * lot_cost_price
-            end_value = lot.value
-            lot.cagr = calculate_cagr(start_value, end_value, years_held)
-
-            port.portfolio[lot.symbol].total_cost += lot.qty * lot_cost_price
-            port.portfolio[lot.symbol].cagr_weight += lot.cagr * lot.qty * lot_cost_price
-
-    # Recalculate weighted average CAGR after fixing individual lot CAGRs
-    weighted_average_cagr = port.calculate_weighted_average_cagr()
+            cash_by_file.append((file_path.split('/')[-1], cash))
+    return cash_by_file
+
+
+def main(paths=PATHS, current_date=None, refresh=True, chart=True, pdfs=PDF_EXPORTS):
+    """
+    Print the holdings report as of current_date ('MM/DD/YYYY', default the
+    most recent working day) and, if chart is set, plot it.
+    """
+    port = Portfolio()
+    total_value = 0.0
+    total_gain = 0.0
+
+    # Convert PDFs to CSV and capture cash from money market funds
+    cash_from_pdf = {}
+    if pdfs:
+        # pdfplumber is only needed when there are statements to convert
+        from pdf_to_csv import convert_to_csv
+    for pdf_path, csv_path, label in pdfs:
+        pdf_cash = convert_to_csv(pdf_path, csv_path)
+        if pdf_cash:
+            cash_from_pdf[label] = pdf_cash
+
+    CURRENT_DATE = current_date or most_recent_working_day()
+
+    print(f'Analyzing portfolio as of {CURRENT_DATE}...')
+    # Parses every export once (in parallel); the refresh and the report
+    # below share the memoized result
+    if refresh:
+        refresh_stock_data(paths)
+    exports = parse_exports(paths)
+    current_day = ticker_store.iso_to_day(convert_date_format(CURRENT_DATE))
+
+    total_cash_from_csv = sum(cash_from_pdf.values())
+    cash_by_file = dict(cash_from_pdf)  # Start with PDF cash
+    for file_name, cash in add_exports(port, paths, exports, current_day):
+        cash_by_file[file_name] = cash
+        total_cash_from_csv += cash
+
+    # Value every lot at CURRENT_DATE and roll up per symbol; lot CAGRs from
+    # the CSV may be stale, so they are recomputed from current prices
+    with instrument.span('summarize'):
+        summary = summarize_holdings(port, port.lots, CURRENT_DATE)
+        port.portfolio = summary.stocks()
+        weighted_average_cagr = summary.weighted_average_cagr
+        # Lots as cash flows: cost paid on acquisition, value received at CURRENT_DATE
+        portfolio_xirr, _ = money_weighted_returns(port.lots, summary.lot_value, current_day)
+        # Purchases move the value but not this one
+        _, portfolio_twr = annualized_twr(port, port.lots, current_day)
 
     # Separate cash (money market funds) from stocks
     cash_holdings = {}
@@ -326,11 +373,6 @@ if __name__ == '__main__':
     total_values.append(grand_total_values)
     all_cagrs.append(0.0)
 
-    # Create color lists for each chart (Cash bar will be green)
-    colors_blue = ['green' if sym == 'Cash' else 'blue' for sym in symbols]
-    colors_orange = ['green' if sym == 'Cash' else 'orange' for sym in symbols]
-    colors_purple = ['green' if sym == 'Cash' else 'purple' for sym in symbols]
-
     print(f'\n{"="*80}')
     print(f'PORTFOLIO SUMMARY')
     print(f'{"="*80}')
@@ -338,71 +380,14 @@ if __name__ == '__main__':
     print(f'Total Gain:           ${total_gain:,.2f}')
     print(f'Cost Basis:           ${total_cost:,.2f}')
     print(f'Weighted Avg CAGR:    {weighted_average_cagr:.2%}')
+    print(f'Money-Weighted XIRR:  {portfolio_xirr:.2%}')
+    print(f'Time-Weighted Return: {portfolio_twr:.2%} a year')
     print(f'{"="*80}\n')
 
-    # Create a figure with 2 rows and 2 columns using gridspec
-    fig, axes = plt.subplots(2, 2, figsize=(14, 10), gridspec_kw={'height_ratios': [1, 1]})
+    if chart:
+        plot_holdings(symbols, values, gains, total_values, all_cagrs)
+    return summary
 
-    # First plot: Percentage of total portfolio (top-left)
-    bars = axes[0, 0].bar(symbols, values, color=colors_blue)
-    axes[0, 0].set_title('Percentage of total portfolio')
-    # axes[0, 0].set_xlabel('Stock Symbol')
-    axes[0, 0].set_ylabel('Percentage (%)')
 
-    for bar in bars:
-        yval = bar.get_height()
-        axes[0, 0].text(bar.get_x() + bar.get_width() / 2, yval, f'{yval:.2f}', ha='center', va='bottom')
-
-    # Second plot: Stock Gains (top-right)
-    gain_bars = axes[0, 1].bar(symbols, gains, color='green')
-    axes[0, 1].set_title('Stock Gains')
-    # axes[0, 1].set_xlabel('Stock Symbol')
-    axes[0, 1].set_ylabel('Gains')
-
-    for bar in gain_bars:
-        yval = bar.get_height()
-        axes[0, 1].text(bar.get_x() + bar.get_width() / 2, yval, f'{yval:,.0f}', ha='center', va='bottom')
-
-    # Third plot: Total Values (bottom, spanning both columns)
-    # Remove the extra axis in the second column
-    # fig.delaxes(axes[1, 0])
-    # fig.delaxes(axes[1, 1])
-
-    # Create a single plot spanning both columns
-    # total_bars = fig.add_subplot(2, 1, 2)  # This makes a single subplot spanning the second row
-    axes[1, 0].bar(symbols, total_values, color=colors_orange)
-    axes[1, 0].set_title('Total Values')
-    # axes[1, 0].set_xlabel('Stock Symbol')
-    axes[1, 0].set_ylabel('Total Value ($)')
-
-    # Remove the default numeric x-axis labels and set the stock symbols
-    # total_bars.set_xticks(range(len(symbols)))  # Set positions of the symbols
-    # total_bars.set_xticklabels(symbols)  # Replace numbers with symbols
-
-    for bar in axes[1, 0].patches:
-        yval = bar.get_height()
-        axes[1, 0].text(
-            bar.get_x() + bar.get_width() / 2,
-            yval,
-            f'{yval:,.0f}',  # 🔹 Format with thousands separator
-            ha='center',
-            va='bottom'
-        )
-
-    axes[1, 1].bar(symbols, all_cagrs, color=colors_purple)
-    axes[1, 1].set_title('CAGR')
-    # axes[1, 1].set_xlabel('Stock Symbol')
-    axes[1, 1].set_ylabel('CAGR (%)')
-
-    for bar in axes[1, 1].patches:
-        yval = bar.get_height()
-        axes[1, 1].text(bar.get_x() + bar.get_width() / 2, yval, f'{yval:,.0f}', ha='center', va='bottom')
-
-    # Adjust layout to minimize white space
-    plt.tight_layout()
-
-    plt.show()
-
-    # port.write_ticker_cache()
-    # port.generate_worm()
-    # port.plot_timeline()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Vectorized holdings summary.
+
+summarize_holdings() values every lot of a LotTable at a given date and rolls
+the results up per symbol and for the whole portfolio in one pass over the
+lot arrays: market value, gain, cost, per-lot CAGR and cost-weighted CAGR.
+Cached prices are looked up once per symbol for the acquisition dates and
+once per symbol for the valuation date.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+
+import ticker_store
+from export_schemas import EPOCH_ORDINAL
+from portfolio import StockInfo, YEARS_CUTOFF, convert_date_format
+
+
+@dataclass
+class HoldingsSummary:
+    # Per symbol, indexed like symbols
+    symbols: list
+    qty: np.ndarray
+    value: np.ndarray
+    gain: np.ndarray
+    total_cost: np.ndarray   # cost at market price on acquisition, CAGR lots only
+    cagr_weight: np.ndarray  # sum of lot CAGR x lot total_cost
+    # Per lot, indexed like the LotTable
+    lot_value: np.ndarray
+    lot_gain: np.ndarray
+    lot_cagr: np.ndarray     # NaN where the lot keeps no CAGR
+    weighted_average_cagr: float
+
+    def symbol_cagr(self):
+        """Cost-weighted CAGR per symbol, NaN for symbols without CAGR lots."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.total_cost > 0, self.cagr_weight / self.total_cost, np.nan)
+
+    def total_value(self):
+        return float(self.value.sum())
+
+    def total_gain(self):
+        return float(self.gain.sum())
+
+    def portfolio_cagr(self):
+        """Cost-weighted CAGR over every symbol's CAGR lots."""
+        total_cost = self.total_cost.sum()
+        return float(self.cagr_weight.sum() / total_cost) if total_cost > 0 else 0.0
+
+    def stocks(self):
+        """{symbol: StockInfo} as gains.py reports them."""
+        stocks = {}
+        for i, symbol in enumerate(self.symbols):
+            stock = stocks[symbol] = StockInfo(symbol)
+            stock.qty = float(self.qty[i])
+            stock.value = float(self.value[i])
+            stock.gain = float(self.gain[i])
+            stock.cagr_weight = float(self.cagr_weight[i])
+            stock.total_cost = float(self.total_cost[i])
+        return stocks
+
+
+def weighted_average_cagr(price_paid, qty, cagr):
+    """
+    Average lot CAGR weighted by cost basis. Lots without a CAGR still count
+    towards the total weight.
+    """
+    weight = price_paid * qty
+    total_weight = weight.sum()
+    if total_weight == 0:
+        return 0.0
+    has_cagr = ~np.isnan(cagr) & (cagr != 0)
+    return float((cagr[has_cagr] * weight[has_cagr]).sum() / total_weight)
+
+
+def summarize_holdings(port, lots, current_date, today=None):
+    """
+    Value lots (a LotTable) at current_date ('MM/DD/YYYY') from port's ticker
+    cache. Lot CAGRs are measured from the cached close on the acquisition
+    date over the years held until today; lots held less than YEARS_CUTOFF
+    years, or without a positive close at acquisition, keep the CAGR they
+    were parsed with.
+    """
+    today = today or datetime.now()
+    current_day = ticker_store.iso_to_day(convert_date_format(current_date))
+    cost_price = port.lot_prices(lots, lots.day)
+    current_price = port.lot_prices(lots, np.full(len(lots), current_day))
+
+    lot_value = lots.qty * current_price
+    lot_gain = lot_value - lots.price_paid * lots.qty
+
+    years_held = (today.date().toordinal() - EPOCH_ORDINAL - lots.day.astype(np.int64)) / 365.25
+    measured = (years_held >= YEARS_CUTOFF) & (cost_price > 0)
+    start_value = lots.qty * cost_price
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cagr = (lot_value / start_value) ** (1 / years_held) - 1
+    lot_cagr = np.where(measured, cagr, lots.cagr)
+
+    # Symbols with lots, in the order they first appear
+    held = lots.held_symbols()
+    codes = np.array([lots.code(symbol) for symbol in held], dtype=np.int64)
+
+    def by_symbol(values):
+        return lots.sum_by_symbol(values)[codes]
+
+    return HoldingsSummary(
+        symbols=held,
+        qty=by_symbol(lots.qty),
+        value=by_symbol(lot_value),
+        gain=by_symbol(lot_gain),
+        total_cost=by_symbol(np.where(measured, start_value, 0.0)),
+        cagr_weight=by_symbol(np.where(measured, cagr * lots.qty * cost_price, 0.0)),
+        lot_value=lot_value,
+        lot_gain=lot_gain,
+        lot_cagr=lot_cagr,
+        weighted_average_cagr=weighted_average_cagr(lots.price_paid, lots.qty, lot_cagr),
+    )
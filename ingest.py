@@ -0,0 +1,111 @@
+"""
+Parallel ingestion of brokerage exports.
+
+parse_exports() reads each CSV export on a process pool and memoizes the
+read by file content hash, so the cache refresh and the gains report share
+one read of every file per run. The reads are memoized before pricing:
+values, cost bases and CAGR that come from the ticker cache are filled in on
+every call, from the histories as they are then.
+
+The reads are also persisted in .cache/lots/, keyed by path and checked by
+mtime, size and content hash, so an export that has not changed since the
+last run is not read at all. Entries are dropped when
+portfolio.PARSER_VERSION changes. Nothing priced is persisted, so a
+re-downloaded or re-adjusted history shows up in the next run's lots.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from portfolio import Portfolio, PARSER_VERSION
+from disk_cache import DiskCache, content_hash, file_stat
+import instrument
+
+
+# content hash -> (LotTable, cash, schema name), as read_csv() returns them
+_parsed = {}
+
+lot_cache = DiskCache('lots', PARSER_VERSION)
+
+
+def parse_file(path):
+    """Read one export, unpriced. Runs in a worker process."""
+    return Portfolio().read_csv(path)
+
+
+def load_cached(path):
+    """
+    Look up a persisted read. Returns (content hash, result or None); the
+    content is only hashed when mtime or size no longer match the entry.
+    """
+    key = os.path.abspath(path)
+    entry = lot_cache.get(key)
+    stat = file_stat(path)
+    if entry is not None and entry['stat'] == stat:
+        return entry['hash'], entry['result']
+    digest = content_hash(path)
+    if entry is not None and entry['hash'] == digest:
+        lot_cache.put(key, dict(entry, stat=stat))
+        return digest, entry['result']
+    return digest, None
+
+
+def store_cached(path, digest, result):
+    key = os.path.abspath(path)
+    lot_cache.put(key, {'stat': file_stat(path), 'hash': digest, 'result': result})
+
+
+@instrument.span('parse_exports')
+def parse_exports(paths, current_date=None, fetch_AAPL_price=False, max_workers=None,
+                  ticker_dir=None, use_cache=True, priced=True):
+    """
+    Parse every export, reading each distinct file content at most once, in
+    parallel, and pricing the lots (Portfolio.price_lots) from the ticker
+    cache in ticker_dir (default the price provider's store) unless priced
+    is False.
+
+    Returns {path: (LotTable, cash)} in the order of paths. Tables are
+    copies, so callers may adjust them without touching the memoized read.
+    """
+    keys = {}
+    todo = {}
+    for path in paths:
+        if use_cache:
+            digest, cached = load_cached(path)
+        else:
+            digest, cached = content_hash(path), None
+        key = digest
+        keys[path] = key
+        if key in _parsed:
+            instrument.count('ingest.memo_hit')
+            continue
+        if cached is not None:
+            _parsed[key] = cached
+        elif key not in todo:
+            todo[key] = path
+
+    instrument.count('ingest.parsed', len(todo))
+    if len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {
+                key: pool.submit(parse_file, path)
+                for key, path in todo.items()
+            }
+            for key, future in futures.items():
+                _parsed[key] = future.result()
+    else:
+        for key, path in todo.items():
+            _parsed[key] = parse_file(path)
+
+    if use_cache:
+        for key, path in todo.items():
+            store_cached(path, key, _parsed[key])
+
+    pricer = Portfolio(ticker_dir=ticker_dir)
+    results = {}
+    for path, key in keys.items():
+        lots, cash, schema = _parsed[key]
+        lots = lots.copy()
+        if priced:
+            pricer.price_lots(lots, schema, current_date, fetch_AAPL_price)
+        results[path] = (lots, cash)
+    return results
@@ -0,0 +1,135 @@
+"""
+Timing spans and counters for profiling a run.
+
+    with instrument.span('parse_csv'):
+        ...
+    instrument.count('cache.lots.hit')
+
+Nothing is recorded until enable() is called (portfolio_cli --profile), so
+the hooks left in the pipeline cost one flag check otherwise. Spans nest per
+thread and are aggregated by their path ('gains/refresh/parse_exports'); a
+span entered again inside itself (recursion) is timed once, by the outer
+call. summary() prints calls and wall time per path next to the counters, and
+write_trace() saves every span as a Chrome trace (chrome://tracing,
+Perfetto). Work done inside process-pool workers is not seen, only the
+parent's span around it.
+"""
+import threading
+import time
+
+
+_enabled = False
+_lock = threading.Lock()
+_local = threading.local()
+_start = time.perf_counter()
+_spans = {}     # path -> [calls, seconds]
+_counters = {}  # name -> count
+_events = []    # (path, thread id, start, seconds)
+
+
+def enable():
+    """Start recording, from a clean slate."""
+    global _enabled, _start
+    reset()
+    _start = time.perf_counter()
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+        _events.clear()
+
+
+def count(name, n=1):
+    """Add n to a counter."""
+    if _enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + n
+
+
+class span:
+    """Context manager (or decorator) timing a block under name, nested in the current span."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if _enabled:
+            stack = _local.__dict__.setdefault('stack', [])
+            if stack and stack[-1].rsplit('/', 1)[-1] == self.name:
+                return self
+            stack.append(f'{stack[-1]}/{self.name}' if stack else self.name)
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if _enabled and getattr(self, 'started', None) is not None:
+            seconds = time.perf_counter() - self.started
+            path = _local.stack.pop()
+            with _lock:
+                totals = _spans.setdefault(path, [0, 0.0])
+                totals[0] += 1
+                totals[1] += seconds
+                _events.append((path, threading.get_ident(), self.started - _start, seconds))
+            self.started = None
+        return False
+
+    def __call__(self, func):
+        def timed(*args, **kwargs):
+            with span(self.name):
+                return func(*args, **kwargs)
+        timed.__name__ = func.__name__
+        timed.__doc__ = func.__doc__
+        return timed
+
+
+def spans():
+    """{path: (calls, seconds)} recorded so far."""
+    with _lock:
+        return {path: tuple(totals) for path, totals in _spans.items()}
+
+
+def counters():
+    with _lock:
+        return dict(_counters)
+
+
+def summary():
+    """Table of the spans, nested under their parents, then the counters."""
+    lines = [f'{"Span":50s} {"Calls":>8s} {"Total ms":>11s} {"Mean ms":>10s}']
+    for path, (calls, seconds) in sorted(spans().items()):
+        depth = path.count('/')
+        label = '  ' * depth + path.rsplit('/', 1)[-1]
+        lines.append(f'{label:50s} {calls:8d} {seconds * 1000:11.1f} {seconds * 1000 / calls:10.3f}')
+    recorded = counters()
+    if recorded:
+        lines.append('')
+        lines.append(f'{"Counter":50s} {"Count":>8s}')
+        for name, n in sorted(recorded.items()):
+            lines.append(f'{name:50s} {n:8d}')
+    return '\n'.join(lines)
+
+
+def write_trace(path):
+    """Write the recorded spans (complete events) and final counter values as a Chrome trace JSON file."""
+    import json
+    with _lock:
+        events = [{'name': name.rsplit('/', 1)[-1], 'cat': name, 'ph': 'X', 'pid': 0, 'tid': tid,
+                   'ts': round(start * 1e6, 3), 'dur': round(seconds * 1e6, 3)}
+                  for name, tid, start, seconds in _events]
+        end = max((e['ts'] + e['dur'] for e in events), default=0)
+        events.extend({'name': name, 'ph': 'C', 'pid': 0, 'tid': 0, 'ts': end, 'args': {'count': n}}
+                      for name, n in sorted(_counters.items()))
+    with open(path, 'w') as fd:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fd)
@@ -0,0 +1,247 @@
+"""
+Columnar storage for tax lots.
+
+A LotTable keeps one numpy array per LotInfo field: symbols as int32 codes
+into a list of names, acquisition dates as int32 days since the epoch and the
+money fields as float64, with NaN standing in for None in the nullable ones
+(days gain, total gain %, CAGR). Filtering, grouping by symbol and valuing
+lots are array operations; iterating yields LotRow views that read and write
+the arrays through the LotInfo attribute names, so per-lot code keeps working.
+"""
+import hashlib
+import math
+
+import numpy as np
+
+from export_schemas import parse_date
+from ticker_store import day_to_iso
+
+
+FLOAT_COLUMNS = ('qty', 'price_paid', 'days_gain', 'total_gain', 'total_gain_percent', 'value', 'cagr')
+
+
+def day_to_us_date(day):
+    """Days since the epoch -> 'MM/DD/YYYY', the date format LotInfo uses."""
+    year, month, dom = day_to_iso(day).split('-')
+    return f'{month}/{dom}/{year}'
+
+
+def _nullable(value):
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+class LotRow:
+    """One lot of a LotTable, with the attributes of portfolio.LotInfo."""
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    @property
+    def symbol(self):
+        return self.table.symbols[self.table.symbol_code[self.index]]
+
+    @symbol.setter
+    def symbol(self, symbol):
+        self.table.symbol_code[self.index] = self.table.code(symbol, add=True)
+
+    @property
+    def date(self):
+        return day_to_us_date(self.table.day[self.index])
+
+    @property
+    def day(self):
+        return int(self.table.day[self.index])
+
+    @property
+    def qty(self):
+        return float(self.table.qty[self.index])
+
+    @qty.setter
+    def qty(self, value):
+        self.table.qty[self.index] = value
+
+    @property
+    def price_paid(self):
+        return _nullable(self.table.price_paid[self.index])
+
+    @price_paid.setter
+    def price_paid(self, value):
+        self.table.price_paid[self.index] = np.nan if value is None else value
+
+    @property
+    def days_gain(self):
+        return _nullable(self.table.days_gain[self.index])
+
+    @days_gain.setter
+    def days_gain(self, value):
+        self.table.days_gain[self.index] = np.nan if value is None else value
+
+    @property
+    def total_gain(self):
+        return float(self.table.total_gain[self.index])
+
+    @total_gain.setter
+    def total_gain(self, value):
+        self.table.total_gain[self.index] = value
+
+    @property
+    def total_gain_percent(self):
+        return _nullable(self.table.total_gain_percent[self.index])
+
+    @total_gain_percent.setter
+    def total_gain_percent(self, value):
+        self.table.total_gain_percent[self.index] = np.nan if value is None else value
+
+    @property
+    def value(self):
+        return float(self.table.value[self.index])
+
+    @value.setter
+    def value(self, value):
+        self.table.value[self.index] = value
+
+    @property
+    def cagr(self):
+        return _nullable(self.table.cagr[self.index])
+
+    @cagr.setter
+    def cagr(self, value):
+        self.table.cagr[self.index] = np.nan if value is None else value
+
+    def to_lot(self):
+        from portfolio import LotInfo
+        return LotInfo(self.symbol, self.date, self.qty, self.price_paid, self.days_gain, self.total_gain,
+                       self.total_gain_percent, self.value, self.cagr)
+
+    def __repr__(self):
+        return repr(self.to_lot())
+
+
+class LotTable:
+    def __init__(self, symbols=None, symbol_code=None, day=None, **columns):
+        self.symbols = list(symbols or [])
+        self._codes = {symbol: code for code, symbol in enumerate(self.symbols)}
+        self.symbol_code = np.asarray(symbol_code if symbol_code is not None else [], dtype=np.int32)
+        self.day = np.asarray(day if day is not None else [], dtype=np.int32)
+        for name in FLOAT_COLUMNS:
+            values = columns.get(name)
+            if values is None:
+                values = np.full(len(self.day), np.nan)
+            setattr(self, name, np.asarray(values, dtype=np.float64))
+
+    @classmethod
+    def from_columns(cls, symbols, days, **columns):
+        """Build from per-lot symbol names, epoch days and field values (None for missing)."""
+        names = list(dict.fromkeys(symbols))
+        codes = {symbol: code for code, symbol in enumerate(names)}
+        symbol_code = np.fromiter((codes[s] for s in symbols), dtype=np.int32, count=len(symbols))
+        floats = {
+            name: np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+            for name, values in columns.items()
+        }
+        return cls(names, symbol_code, days, **floats)
+
+    @classmethod
+    def from_lots(cls, lots):
+        """Build from LotInfo objects (or anything with the same attributes)."""
+        if isinstance(lots, LotTable):
+            return lots
+        lots = list(lots)
+        days = [parse_date(lot.date)[1] for lot in lots]
+        return cls.from_columns([lot.symbol for lot in lots], days,
+                                **{name: [getattr(lot, name) for lot in lots] for name in FLOAT_COLUMNS})
+
+    def __len__(self):
+        return len(self.day)
+
+    def __iter__(self):
+        return (LotRow(self, i) for i in range(len(self)))
+
+    def __getitem__(self, key):
+        """An int gives a LotRow view; a mask, index array or slice gives a new table."""
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += len(self)
+            if not 0 <= key < len(self):
+                raise IndexError('lot index out of range')
+            return LotRow(self, int(key))
+        return LotTable(self.symbols, self.symbol_code[key], self.day[key],
+                        **{name: getattr(self, name)[key] for name in FLOAT_COLUMNS})
+
+    def __eq__(self, other):
+        if not isinstance(other, LotTable):
+            return NotImplemented
+        return (len(self) == len(other) and
+                self.symbol_names().tolist() == other.symbol_names().tolist() and
+                np.array_equal(self.day, other.day) and
+                all(np.array_equal(getattr(self, name), getattr(other, name), equal_nan=True)
+                    for name in FLOAT_COLUMNS))
+
+    def __repr__(self):
+        return f'LotTable({len(self)} lots, {len(self.symbols)} symbols)'
+
+    def code(self, symbol, add=False):
+        """The code of symbol, or -1 if it has none (a new one when add is set)."""
+        code = self._codes.get(symbol, -1)
+        if code < 0 and add:
+            code = self._codes[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return code
+
+    def symbol_names(self):
+        """Per-lot symbol names as an object array."""
+        return np.array(self.symbols, dtype=object)[self.symbol_code] if len(self) else np.array([], dtype=object)
+
+    def symbol_mask(self, symbols):
+        """Boolean mask of the lots whose symbol is symbols (a name or a collection of names)."""
+        if isinstance(symbols, str):
+            symbols = [symbols]
+        codes = [self._codes[s] for s in symbols if s in self._codes]
+        return np.isin(self.symbol_code, codes)
+
+    def held_symbols(self):
+        """Symbols with at least one lot, in first-seen order."""
+        used = np.zeros(len(self.symbols), dtype=bool)
+        used[self.symbol_code] = True
+        return [symbol for symbol, u in zip(self.symbols, used) if u]
+
+    def sum_by_symbol(self, values):
+        """Per-symbol totals of a per-lot array, indexed by symbol code."""
+        return np.bincount(self.symbol_code, weights=values, minlength=len(self.symbols))
+
+    def cost(self):
+        return self.price_paid * self.qty
+
+    def fingerprint(self, columns=('qty', 'price_paid')):
+        """Digest of the lots' symbols, acquisition days and the given columns, in lot order."""
+        digest = hashlib.sha256('\0'.join(self.symbol_names()).encode())
+        digest.update(self.day.tobytes())
+        for name in columns:
+            digest.update(getattr(self, name).tobytes())
+        return digest.hexdigest()
+
+    def copy(self):
+        return LotTable(self.symbols, self.symbol_code.copy(), self.day.copy(),
+                        **{name: getattr(self, name).copy() for name in FLOAT_COLUMNS})
+
+    def extend(self, lots):
+        """Append lots (a LotTable or LotInfo-like objects) in place."""
+        other = LotTable.from_lots(lots)
+        remap = np.array([self.code(symbol, add=True) for symbol in other.symbols], dtype=np.int32)
+        self.symbol_code = np.concatenate([self.symbol_code, remap[other.symbol_code] if len(remap) else other.symbol_code])
+        self.day = np.concatenate([self.day, other.day])
+        for name in FLOAT_COLUMNS:
+            setattr(self, name, np.concatenate([getattr(self, name), getattr(other, name)]))
+        return self
+
+    def append(self, lot):
+        return self.extend([lot])
+
+    def __iadd__(self, lots):
+        return self.extend(lots)
+
+    def to_lots(self):
+        return [row.to_lot() for row in self]
@@ -3,13 +3,25 @@
 1099-B Stock Sales Parser
 Extracts stock sell transactions from 1099-B tax forms (PDF)
 """
-import pdfplumber
 import re
-import pandas as pd
 from datetime import datetime
 import sys
 from pathlib import Path
 
+from disk_cache import DiskCache, content_hash
+from pdf_text import cached_page_texts
+from phrase_match import PhraseMatcher, with_user_phrases
+
+# pandas is only needed for the summary in main() and is imported there, so
+# page-extraction workers start without it
+
+# Bump when a change to parse_1099b_text() changes the transactions it finds
+PARSER_VERSION = 1
+
+# (PDF content hash, company names) -> transactions, without the 'Source File'
+# column; the names include any added in config.py
+transaction_cache = DiskCache('1099b', PARSER_VERSION)
+
 # Pattern to match company header line (e.g., "TESLA INC CUSIP: 88160R101 Symbol: TSLA")
 COMPANY_PATTERN = re.compile(r'^(.+?)\s+CUSIP:\s*(\w+)\s+Symbol:\s*(.*)$')
 
@@ -20,6 +32,9 @@ TRANSACTION_PATTERN_MS = re.compile(
     r'\$?([\d,]+\.\d{2})\s+\(?\$?([\d,]+\.\d{2}|-?\d+\.\d{2})\)?\s+\$?([\d,]+\.\d{2})'
 )
 
+# CUSIP number following "CUSIP:" on an E*TRADE line
+CUSIP_PATTERN = re.compile(r'\s*(\w+)')
+
 # Pattern for E*TRADE format (2020-2023)
 # Format: [optional company name] quantity date_acquired date_sold proceeds cost_basis discount wash_sale gain/loss
 TRANSACTION_PATTERN_ETRADE = re.compile(
@@ -114,153 +129,204 @@ COMPANY_TO_SYMBOL = {
     'VIRGIN GALACTIC': 'SPCE',
 }
 
+# First name in COMPANY_TO_SYMBOL order contained in a company name, with the
+# COMPANY_SYMBOLS entries from config.py checked first
+COMPANY_MATCHER = PhraseMatcher(with_user_phrases(COMPANY_TO_SYMBOL), ignore_case=True)
+
+# Text before an E*TRADE transaction that is not a company name (stock
+# classes, headers, etc.), as one alternation so each line is searched once
+JUNK_PATTERNS = [
+    'CUSIP', 'Subtotals', 'Total', 'ITEMS', 'Accrued', 'Wash Sale',
+    'Description', 'Date Acquired', 'Date Sold', 'Proceeds', 'Cost', 'Basis',
+    'UNIT SER', 'ETF', 'SHS', 'COM$', '^COM CLASS', '^CLASS A', '^COMMON STOCK',
+    'CORPORATION COM$', 'SPONSORED ADR$', 'AMERICAN DEPOSITARY',
+    'ORDINARY SHARES$', 'RPRSNTNG', '^ADS EACH', '^CORPORATION NEW$'
+]
+JUNK_PATTERN = re.compile('|'.join(f'(?:{pattern})' for pattern in JUNK_PATTERNS), re.IGNORECASE)
+
 def infer_symbol_from_company(company_name):
     """Try to infer ticker symbol from company name"""
     if not company_name:
         return None
-
-    company_upper = company_name.upper()
-
-    # Check direct matches
-    for key, symbol in COMPANY_TO_SYMBOL.items():
-        if key.upper() in company_upper:
-            return symbol
-
-    return None
+    return COMPANY_MATCHER.first(company_name)
 
 def clean_currency(value):
     """Remove $, commas, and parentheses from currency values"""
     return float(value.replace('$', '').replace(',', '').replace('(', '').replace(')', ''))
 
-def parse_1099b_pdf(pdf_path):
-    """Extract all stock sale transactions from a 1099-B PDF"""
+def parse_1099b_text(page_texts):
+    """
+    Extract stock sale transactions from the page texts of one 1099-B, in
+    page order. Company, CUSIP and symbol carry over from line to line and
+    across pages, so this pass is sequential.
+    """
     transactions = []
+    current_company = None
+    current_cusip = None
+    current_symbol = None
 
-    with pdfplumber.open(pdf_path) as pdf:
-        current_company = None
-        current_cusip = None
-        current_symbol = None
+    for text in page_texts:
+        if not text:
+            continue
 
-        for page in pdf.pages:
-            text = page.extract_text()
-            if not text:
+        lines = text.split('\n')
+
+        for i, line in enumerate(lines):
+            stripped = line.strip()
+
+            # Check for company header (Morgan Stanley format)
+            company_match = COMPANY_PATTERN.match(stripped)
+            if company_match:
+                current_company = company_match.group(1).strip()
+                current_cusip = company_match.group(2).strip()
+                current_symbol = company_match.group(3).strip() if company_match.group(3) else None
                 continue
 
-            lines = text.split('\n')
+            # Check for CUSIP line (E*TRADE format) - e.g., "CUSIP: 46090E103"
+            # CUSIP can be standalone or embedded in transaction line
+            if 'CUSIP:' in stripped:
+                cusip_part = stripped.split('CUSIP:')[1]
+                # Extract just the CUSIP number (before any transaction data)
+                cusip_match = CUSIP_PATTERN.match(cusip_part)
+                if cusip_match:
+                    current_cusip = cusip_match.group(1)
+                # Don't continue - might have transaction data on same line
+
+            # Try Morgan Stanley format transaction pattern
+            txn_match = TRANSACTION_PATTERN_MS.match(stripped)
+            is_ms_format = bool(txn_match)
+
+            if not txn_match:
+                # Try E*TRADE format transaction pattern
+                txn_match = TRANSACTION_PATTERN_ETRADE.search(stripped)
+
+            if txn_match:
+                if is_ms_format:
+                    # Morgan Stanley format
+                    quantity, date_acq, date_sold, proceeds, cost_basis, discount, wash_sale, gain_loss, tax_withheld = txn_match.groups()
+                else:
+                    # E*TRADE format (no separate tax withheld column)
+                    quantity, date_acq, date_sold, proceeds, cost_basis, discount, wash_sale, gain_loss = txn_match.groups()
+                    tax_withheld = "0.00"
+
+                    # E*TRADE format: extract company name from text before transaction pattern
+                    match_start = txn_match.start()
+                    if match_start > 0:
+                        potential_company = stripped[:match_start].strip()
+                        # Remove *** prefix if present (PDF marker)
+                        if potential_company.startswith('***'):
+                            potential_company = potential_company[3:].strip()
+
+                        # Filter out junk text (stock classes, headers, etc.)
+                        is_junk = JUNK_PATTERN.search(potential_company) is not None
+
+                        # Valid company names: alphabetic start, reasonable length, not junk
+                        if (potential_company and
+                            len(potential_company) > 5 and
+                            len(potential_company) < 80 and
+                            potential_company[0].isalpha() and
+                            not is_junk):
+                            current_company = potential_company
+                            current_symbol = None  # Reset symbol for new company
+
+                    # If no valid company name on this line, use current company
+                    # Always try to infer symbol for E*TRADE format
+                    if not current_symbol and current_company:
+                        current_symbol = infer_symbol_from_company(current_company)
 
-            for i, line in enumerate(lines):
-                stripped = line.strip()
+                # Handle negative gain/loss (losses are shown in parentheses or with negative sign)
+                if '(' in gain_loss or gain_loss.startswith('-'):
+                    gain_loss = gain_loss.replace('(', '').replace(')', '')
+                    if not gain_loss.startswith('-'):
+                        gain_loss = '-' + gain_loss
 
-                # Check for company header (Morgan Stanley format)
-                company_match = COMPANY_PATTERN.match(stripped)
-                if company_match:
-                    current_company = company_match.group(1).strip()
-                    current_cusip = company_match.group(2).strip()
-                    current_symbol = company_match.group(3).strip() if company_match.group(3) else None
+                # Skip subtotal lines
+                if 'Subtotals' in stripped or 'ITEMS' in stripped or 'Total' in stripped:
                     continue
 
-                # Check for CUSIP line (E*TRADE format) - e.g., "CUSIP: 46090E103"
-                # CUSIP can be standalone or embedded in transaction line
-                if 'CUSIP:' in stripped:
-                    cusip_part = stripped.split('CUSIP:')[1]
-                    # Extract just the CUSIP number (before any transaction data)
-                    cusip_match = re.match(r'\s*(\w+)', cusip_part)
-                    if cusip_match:
-                        current_cusip = cusip_match.group(1)
-                    # Don't continue - might have transaction data on same line
-
-                # Try Morgan Stanley format transaction pattern
-                txn_match = TRANSACTION_PATTERN_MS.match(stripped)
-                is_ms_format = bool(txn_match)
-
-                if not txn_match:
-                    # Try E*TRADE format transaction pattern
-                    txn_match = TRANSACTION_PATTERN_ETRADE.search(stripped)
-
-                if txn_match:
-                    if is_ms_format:
-                        # Morgan Stanley format
-                        quantity, date_acq, date_sold, proceeds, cost_basis, discount, wash_sale, gain_loss, tax_withheld = txn_match.groups()
-                    else:
-                        # E*TRADE format (no separate tax withheld column)
-                        quantity, date_acq, date_sold, proceeds, cost_basis, discount, wash_sale, gain_loss = txn_match.groups()
-                        tax_withheld = "0.00"
-
-                        # E*TRADE format: extract company name from text before transaction pattern
-                        match_start = txn_match.start()
-                        if match_start > 0:
-                            potential_company = stripped[:match_start].strip()
-                            # Remove *** prefix if present (PDF marker)
-                            if potential_company.startswith('***'):
-                                potential_company = potential_company[3:].strip()
-
-                            # Filter out junk text (stock classes, headers, etc.)
-                            junk_patterns = [
-                                'CUSIP', 'Subtotals', 'Total', 'ITEMS', 'Accrued', 'Wash Sale',
-                                'Description', 'Date Acquired', 'Date Sold', 'Proceeds', 'Cost', 'Basis',
-                                'UNIT SER', 'ETF', 'SHS', 'COM$', '^COM CLASS', '^CLASS A', '^COMMON STOCK',
-                                'CORPORATION COM$', 'SPONSORED ADR$', 'AMERICAN DEPOSITARY',
-                                'ORDINARY SHARES$', 'RPRSNTNG', '^ADS EACH', '^CORPORATION NEW$'
-                            ]
-                            is_junk = any(re.search(pattern, potential_company, re.IGNORECASE) for pattern in junk_patterns)
-
-                            # Valid company names: alphabetic start, reasonable length, not junk
-                            if (potential_company and
-                                len(potential_company) > 5 and
-                                len(potential_company) < 80 and
-                                potential_company[0].isalpha() and
-                                not is_junk):
-                                current_company = potential_company
-                                current_symbol = None  # Reset symbol for new company
-
-                        # If no valid company name on this line, use current company
-                        # Always try to infer symbol for E*TRADE format
-                        if not current_symbol and current_company:
-                            current_symbol = infer_symbol_from_company(current_company)
-
-                    # Handle negative gain/loss (losses are shown in parentheses or with negative sign)
-                    if '(' in gain_loss or gain_loss.startswith('-'):
-                        gain_loss = gain_loss.replace('(', '').replace(')', '')
-                        if not gain_loss.startswith('-'):
-                            gain_loss = '-' + gain_loss
-
-                    # Skip subtotal lines
-                    if 'Subtotals' in stripped or 'ITEMS' in stripped or 'Total' in stripped:
-                        continue
-
-                    # Try to infer symbol from company name if missing
-                    if not current_symbol and current_company:
-                        current_symbol = infer_symbol_from_company(current_company)
+                # Try to infer symbol from company name if missing
+                if not current_symbol and current_company:
+                    current_symbol = infer_symbol_from_company(current_company)
+
+                transactions.append({
+                    'Company': current_company or 'Unknown',
+                    'Symbol': current_symbol or '',
+                    'CUSIP': current_cusip or '',
+                    'Quantity': float(quantity),
+                    'Date Acquired': date_acq,
+                    'Date Sold': date_sold,
+                    'Proceeds': clean_currency(proceeds),
+                    'Cost Basis': clean_currency(cost_basis),
+                    'Accrued Discount': clean_currency(discount),
+                    'Wash Sale Loss': clean_currency(wash_sale),
+                    'Gain/Loss': clean_currency(gain_loss),
+                    'Fed Tax Withheld': clean_currency(tax_withheld) if tax_withheld else 0.0,
+                })
 
-                    transactions.append({
-                        'Company': current_company or 'Unknown',
-                        'Symbol': current_symbol or '',
-                        'CUSIP': current_cusip or '',
-                        'Quantity': float(quantity),
-                        'Date Acquired': date_acq,
-                        'Date Sold': date_sold,
-                        'Proceeds': clean_currency(proceeds),
-                        'Cost Basis': clean_currency(cost_basis),
-                        'Accrued Discount': clean_currency(discount),
-                        'Wash Sale Loss': clean_currency(wash_sale),
-                        'Gain/Loss': clean_currency(gain_loss),
-                        'Fed Tax Withheld': clean_currency(tax_withheld) if tax_withheld else 0.0,
-                    })
+    return transactions
 
+def transaction_key(digest):
+    return digest, tuple(COMPANY_MATCHER.mapping.items())
+
+def parse_1099b_files(pdf_paths, max_workers=None):
+    """
+    Transactions of each 1099-B, as {path: [transaction, ...]}; a PDF that
+    cannot be read or parsed maps to its exception instead.
+
+    Results are cached by PDF content hash, so an unchanged PDF costs one
+    hash and one cache read. The others are parsed from their (cached) page
+    texts, extracted in parallel across all files.
+    """
+    results = {}
+    digests = {}
+    for path in pdf_paths:
+        try:
+            digests[path] = content_hash(path)
+        except Exception as e:
+            results[path] = e
+            continue
+        transactions = transaction_cache.get(transaction_key(digests[path]))
+        if transactions is not None:
+            results[path] = transactions
+
+    todo = [path for path in digests if path not in results]
+    page_texts = cached_page_texts(todo, digests, max_workers)
+    for path in todo:
+        texts = page_texts[path]
+        if isinstance(texts, Exception):
+            results[path] = texts
+            continue
+        try:
+            results[path] = parse_1099b_text(texts)
+        except Exception as e:
+            results[path] = e
+            continue
+        transaction_cache.put(transaction_key(digests[path]), results[path])
+    return results
+
+def parse_1099b_pdf(pdf_path, max_workers=None):
+    """Extract all stock sale transactions from a 1099-B PDF"""
+    transactions = parse_1099b_files([pdf_path], max_workers)[pdf_path]
+    if isinstance(transactions, Exception):
+        raise transactions
     return transactions
 
-def parse_all_1099b_pdfs(directory_path):
-    """Parse all 1099-B PDFs in a directory"""
+def parse_all_1099b_pdfs(directory_path, max_workers=None):
+    """Parse all 1099-B PDFs in a directory, extracting their pages in parallel"""
     all_transactions = []
     directory = Path(directory_path)
 
     pdf_files = sorted(directory.glob('*.pdf'))
     print(f"Found {len(pdf_files)} PDF files in {directory_path}\n")
 
+    parsed = parse_1099b_files([str(pdf_file) for pdf_file in pdf_files], max_workers)
+
     for pdf_file in pdf_files:
         print(f"Processing: {pdf_file.name}")
         try:
-            transactions = parse_1099b_pdf(str(pdf_file))
+            transactions = parsed[str(pdf_file)]
+            if isinstance(transactions, Exception):
+                raise transactions
             if transactions:
                 # Add source file to each transaction
                 for txn in transactions:
@@ -274,8 +340,11 @@ def parse_all_1099b_pdfs(directory_path):
 
     return all_transactions
 
-def main():
-    directory = '/Users/osman/Downloads/1099s/'
+DEFAULT_DIRECTORY = '/Users/osman/Downloads/1099s/'
+
+
+def main(directory=DEFAULT_DIRECTORY):
+    import pandas as pd
 
     print("="*80)
     print("1099-B STOCK SALES PARSER")
@@ -317,12 +386,12 @@ def main():
               f"Gain/Loss: ${row['Gain/Loss']:12,.2f}")
 
     # Save to CSV
-    output_file = '/Users/osman/Downloads/1099s/stock_sales_summary.csv'
+    output_file = str(Path(directory) / 'stock_sales_summary.csv')
     df.to_csv(output_file, index=False)
     print(f"\n✅ Saved detailed transactions to: {output_file}")
 
     # Save summary by symbol
-    summary_file = '/Users/osman/Downloads/1099s/stock_sales_by_symbol.csv'
+    summary_file = str(Path(directory) / 'stock_sales_by_symbol.csv')
     symbol_summary.to_csv(summary_file)
     print(f"✅ Saved symbol summary to: {summary_file}")
 
@@ -0,0 +1,121 @@
+"""
+Page text of PDF statements, extracted in parallel and cached by content.
+
+extract_texts() splits the pages of every PDF into ranges and runs
+page.extract_text() on a process pool, stitching the results back per file
+in page order. A region function can limit extraction to part of each
+page, or skip pages, from a cheap look at their characters. cached_page_texts()
+keeps the texts in .cache/pdf_text/, keyed by the PDF's content hash, the
+pdfplumber version and the region, so a statement that has not changed is
+never extracted twice.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import pdfplumber
+
+from disk_cache import DiskCache, content_hash
+
+
+# Pages per extraction task; each task opens the PDF once in its worker
+PAGES_PER_TASK = 8
+
+# (content hash, pdfplumber version, region key) -> [page text, ...]
+text_cache = DiskCache('pdf_text', 1)
+
+
+def page_count(pdf_path):
+    with pdfplumber.open(pdf_path) as pdf:
+        return len(pdf.pages)
+
+
+def extract_page_texts(pdf_path, first, last, region=None):
+    """
+    Text of pages first..last-1 of a PDF. Runs in a worker process.
+
+    region(page, next_page), when given, returns the bounding box of the page
+    to extract, or None to skip the page (its text is then None). next_page
+    is None on the last page.
+    """
+    texts = []
+    with pdfplumber.open(pdf_path) as pdf:
+        pages = pdf.pages
+        for number in range(first, last):
+            page = pages[number]
+            if region is None:
+                texts.append(page.extract_text())
+            else:
+                bbox = region(page, pages[number + 1] if number + 1 < len(pages) else None)
+                texts.append(None if bbox is None else page.within_bbox(bbox).extract_text())
+            page.close()
+    return texts
+
+
+def extract_texts(pdf_paths, max_workers=None, pages_per_task=PAGES_PER_TASK, region=None):
+    """
+    Page texts of every PDF, as {path: [text, ...]} in page order.
+
+    The pages of all files are cut into ranges of pages_per_task and
+    extracted on one process pool, then stitched back per file. A file that
+    cannot be read maps to its exception instead of a list. region is passed
+    on to extract_page_texts() and must be a module-level function.
+    """
+    results = {}
+    tasks = []
+    for path in pdf_paths:
+        try:
+            n_pages = page_count(path)
+        except Exception as e:
+            results[path] = e
+            continue
+        results[path] = [None] * n_pages
+        tasks.extend((path, first, min(first + pages_per_task, n_pages))
+                     for first in range(0, n_pages, pages_per_task))
+
+    def store(path, first, texts):
+        if not isinstance(results[path], Exception):
+            results[path][first:first + len(texts)] = texts
+
+    if len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [(path, first, pool.submit(extract_page_texts, path, first, last, region))
+                       for path, first, last in tasks]
+            for path, first, future in futures:
+                try:
+                    store(path, first, future.result())
+                except Exception as e:
+                    results[path] = e
+    else:
+        for path, first, last in tasks:
+            try:
+                store(path, first, extract_page_texts(path, first, last, region))
+            except Exception as e:
+                results[path] = e
+    return results
+
+
+def cached_page_texts(pdf_paths, digests=None, max_workers=None, region=None, region_key=None):
+    """
+    extract_texts() through the text cache. digests maps paths to content
+    hashes the caller already has; the others are hashed here. Only the PDFs
+    without a cached entry are extracted. region_key names the region in the
+    cache and must change whenever what the region selects does.
+    """
+    digests = dict(digests or {})
+    results = {}
+    for path in pdf_paths:
+        try:
+            if path not in digests:
+                digests[path] = content_hash(path)
+        except Exception as e:
+            results[path] = e
+            continue
+        texts = text_cache.get((digests[path], pdfplumber.__version__, region_key))
+        if texts is not None:
+            results[path] = texts
+
+    todo = [path for path in pdf_paths if path not in results]
+    for path, texts in extract_texts(todo, max_workers, region=region).items():
+        if not isinstance(texts, Exception):
+            text_cache.put((digests[path], pdfplumber.__version__, region_key), texts)
+        results[path] = texts
+    return results
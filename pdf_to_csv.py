@@ -1,10 +1,36 @@
-import pdfplumber
-import pandas as pd
+import csv
 import re
+from operator import itemgetter
+
+from pdfminer.layout import LTChar, LTContainer
 from datetime import datetime
 import argparse
 import sys
 
+from disk_cache import DiskCache, content_hash
+import instrument
+from pdf_text import cached_page_texts
+from phrase_match import PhraseMatcher, with_user_phrases
+
+# Bump when a change to parse_lot_text() or lot_region() changes the records found
+PARSER_VERSION = 4
+
+# (PDF content hash, long names) -> (lot records, money market cash, statement
+# date); the names include any added in config.py
+record_cache = DiskCache('fidelity_pdf', PARSER_VERSION)
+
+CSV_COLUMNS = [
+    "Account", "Symbol", "Acquired", "Term", "Quantity", "Average Cost Basis",
+    "Current Value", "Total Gain $", "Total Gain %",
+]
+
+# Written after the lots, like the footer of a Fidelity download: the first
+# line ends the lot data and the second gives the export's as-of date
+CSV_FOOTER = "The data and information in this file was read from a Fidelity statement PDF"
+
+# PDF CreationDate, e.g. "D:20260303101500-05'00'"
+CREATION_DATE_PATTERN = re.compile(r"D:(\d{8})")
+
 # -----------------------------
 # Lot row format
 # -----------------------------
@@ -30,6 +56,9 @@ KNOWN_SYMBOLS = {
     "APPLE": "AAPL",
 }
 
+# Long names in KNOWN_SYMBOLS order, after the COMPANY_SYMBOLS entries from config.py
+SYMBOL_MATCHER = PhraseMatcher(with_user_phrases(KNOWN_SYMBOLS))
+
 # Accept only realistic tickers (blocks Fidelity junk like 'E')
 VALID_SYMBOL_RE = re.compile(r"^[A-Z]{2,5}$")
 
@@ -42,9 +71,20 @@ UI_TOKENS = {
 # Money market funds (used as cash)
 MONEY_MARKET_FUNDS = {'FDRXX', 'SPAXX', 'VMRXX', 'VUSXX', 'SWVXX', 'FDIC'}
 
+# Line that is a money market fund symbol, alone or followed by its description
+MONEY_MARKET_PATTERN = re.compile(r'(%s)(?: |\Z)' % '|'.join(sorted(MONEY_MARKET_FUNDS)))
+
 # Pattern for money market fund cash line (e.g., "$26,787.45 5.74%" or "$56.61 0.10% --")
 CASH_PATTERN = re.compile(r'^\$([0-9,]+\.\d{2})\s+[\d.]+%')
 
+# Lot rows and money market lines as they appear in a page's characters,
+# without spaces (e.g. "Mar-03-2021Long+$1,234.56...", "FDRXXFIDELITY...")
+LOT_SIGNATURE = re.compile(r"[A-Z][a-z]{2}-\d{2}-\d{4}(?:Short|Long)")
+MONEY_MARKET_SIGNATURE = re.compile(r"(?:%s)" % "|".join(sorted(MONEY_MARKET_FUNDS)))
+
+# Known long names as they appear in a page's characters, without spaces
+NAME_SIGNATURE = re.compile("|".join(re.escape(re.sub(r"\s+", "", name)) for name in SYMBOL_MATCHER.mapping))
+
 # -----------------------------
 # Helpers
 # -----------------------------
@@ -57,92 +97,197 @@ def format_date(date_str):
 def clean_number(val):
     return float(val.replace('$', '').replace(',', ''))
 
+def layout_chars(page):
+    """
+    (top, bottom, x0, text) of each character on a page, read from the
+    pdfminer layout. Much cheaper than page.chars, which builds a full
+    attribute dict per character; coordinates match page.chars.
+    """
+    mb_x0, mb_top = page.mediabox[:2]
+    containers = [page.layout]
+    while containers:
+        for obj in containers.pop():
+            if isinstance(obj, LTChar):
+                yield (page.height - obj.y1 + mb_top, page.height - obj.y0 + mb_top,
+                       obj.x0 + mb_x0, obj.get_text())
+            elif isinstance(obj, LTContainer):
+                containers.append(obj)
+
+def char_lines(page, tolerance=3):
+    """The page's characters grouped into lines, as (top, bottom, text without spaces)"""
+    rows = []
+    for char in sorted(layout_chars(page)):
+        if rows and char[0] - rows[-1][0][0] <= tolerance:
+            rows[-1].append(char)
+        else:
+            rows.append([char])
+    return [
+        (min(c[0] for c in row), max(c[1] for c in row),
+         "".join(c[3] for c in sorted(row, key=itemgetter(2)) if not c[3].isspace()))
+        for row in rows
+    ]
+
+def has_lot_rows(page):
+    text = "".join(c[3] for c in layout_chars(page) if not c[3].isspace())
+    return LOT_SIGNATURE.search(text) is not None
+
+def lot_region(page, next_page):
+    """
+    Bounding box of the part of a page parse_lot_text() needs, or None to
+    skip the page. Found from the bare pdfminer characters, so cover pages,
+    disclosures and navigation chrome never go through pdfplumber's
+    character objects or text layout.
+
+    The box runs from the first line above the first lot row or money
+    market line that could name a symbol (ticker, money market fund or known
+    long name), so whatever parse_lot_text() takes the symbol from is kept
+    however far above the lots it is printed, to the line after the last
+    one (money market cash). With no such line the lots continue the
+    previous page's symbol and the box starts at them. When the next page
+    has lot rows it runs to the bottom of the page instead, keeping a symbol
+    header printed just before the page break.
+    """
+    lines = char_lines(page)
+    if not lines:
+        return None
+    marks = [i for i, (_, _, text) in enumerate(lines)
+             if LOT_SIGNATURE.search(text) or MONEY_MARKET_SIGNATURE.match(text)]
+    continues = next_page is not None and has_lot_rows(next_page)
+    if not marks and not continues:
+        return None
+    first = marks[0] if marks else len(lines) - 1
+    start = next((i for i, (_, _, text) in enumerate(lines[:first]) if VALID_SYMBOL_RE.match(text) or
+                  MONEY_MARKET_SIGNATURE.search(text) or NAME_SIGNATURE.search(text)), first)
+    end = len(lines) - 1 if continues else min(marks[-1] + 1, len(lines) - 1)
+    x0, top, x1, bottom = page.bbox
+    return x0, max(lines[start][0] - 1, top), x1, min(lines[end][1] + 1, bottom)
+
 # -----------------------------
-# Main converter
+# Lot parser
 # -----------------------------
-def convert_to_csv(pdf_path, output_csv):
+def parse_lot_text(page_texts):
+    """(lot records, money market cash) from the page texts of a Fidelity PDF"""
     records = []
     account = "BrokerageLink"
     total_cash = 0.0
+    current_symbol = None
+    is_money_market = False
+
+    for text in page_texts:
+        if not text:
+            continue
 
+        lines = text.split('\n')
+        for line in lines:
+            stripped = line.strip()
+            if not stripped:
+                continue
+
+            # Ignore obvious UI noise
+            if stripped in UI_TOKENS:
+                continue
+
+            # Check if this line is a cash value for money market fund
+            if is_money_market:
+                cash_match = CASH_PATTERN.match(stripped)
+                if cash_match:
+                    cash_value = float(cash_match.group(1).replace(',', ''))
+                    total_cash += cash_value
+                is_money_market = False  # Reset after checking next line
+
+            # Case: money market fund with description on same line (e.g., "FDRXX FIDELITY...")
+            mmf_match = MONEY_MARKET_PATTERN.match(stripped)
+            if mmf_match:
+                is_money_market = True
+                current_symbol = mmf_match.group(1)
+
+            # Case: strict symbol-only line (e.g., AVGO, NVDA, FDRXX)
+            if VALID_SYMBOL_RE.match(stripped):
+                current_symbol = stripped
+                # Check if it's a money market fund
+                if stripped in MONEY_MARKET_FUNDS:
+                    is_money_market = True
+                continue
+
+            # Case: exact long-name mapping
+            if stripped in SYMBOL_MATCHER.mapping:
+                current_symbol = SYMBOL_MATCHER.mapping[stripped]
+                continue
+
+            # Case: long name embedded in line
+            current_symbol = SYMBOL_MATCHER.first(stripped, current_symbol)
+
+            # Match lot row
+            match = lot_pattern.match(stripped)
+            if match and current_symbol:
+                (
+                    acquired, term, gain_dollar, gain_pct,
+                    current_value, quantity, avg_cost_basis, cost_basis_total
+                ) = match.groups()
+
+                records.append({
+                    "Account": account,
+                    "Symbol": current_symbol,
+                    "Acquired": format_date(acquired),
+                    "Term": term,
+                    "Quantity": float(quantity),
+                    "Average Cost Basis": float(avg_cost_basis),
+                    "Current Value": float(current_value.replace(',', '')),
+                    "Total Gain $": clean_number(gain_dollar),
+                    "Total Gain %": None if gain_pct == "--" else float(gain_pct.strip('%')),
+                })
+
+    return records, total_cash
+
+def statement_date(pdf_path):
+    """'MM/DD/YYYY' the statement PDF was created (its CreationDate), or None."""
+    import pdfplumber
+    with pdfplumber.open(pdf_path) as pdf:
+        created = pdf.metadata.get("CreationDate")
+    match = CREATION_DATE_PATTERN.match(created) if isinstance(created, str) else None
+    if not match:
+        return None
+    try:
+        return datetime.strptime(match.group(1), "%Y%m%d").strftime("%m/%d/%Y")
+    except ValueError:
+        return None
+
+def parse_lot_pdf(pdf_path):
+    """
+    (lot records, money market cash, statement date) of a PDF, cached by
+    content hash: an unchanged statement costs one hash and one cache read.
+    """
+    digest = content_hash(pdf_path)
+    key = (digest, tuple(SYMBOL_MATCHER.mapping.items()))
+    parsed = record_cache.get(key)
+    if parsed is None:
+        texts = cached_page_texts([pdf_path], {pdf_path: digest}, region=lot_region,
+                                  region_key=("lot_region", PARSER_VERSION))[pdf_path]
+        if isinstance(texts, Exception):
+            raise texts
+        parsed = parse_lot_text(texts) + (statement_date(pdf_path),)
+        record_cache.put(key, parsed)
+    return parsed
+
+def write_records(records, output_csv, as_of=None):
+    """Write the lot records as a CSV, ending with CSV_FOOTER and an "As of MM/DD/YYYY" line when as_of is known."""
+    with open(output_csv, 'w', newline='') as fd:
+        writer = csv.DictWriter(fd, fieldnames=CSV_COLUMNS, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(records)
+        if as_of:
+            fd.write(f"\n{CSV_FOOTER}\nAs of {as_of}\n")
+
+# -----------------------------
+# Main converter
+# -----------------------------
+@instrument.span('convert_to_csv')
+def convert_to_csv(pdf_path, output_csv):
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            current_symbol = None
-            is_money_market = False
-
-            for page in pdf.pages:
-                text = page.extract_text()
-                if not text:
-                    continue
-
-                lines = text.split('\n')
-                for line in lines:
-                    stripped = line.strip()
-                    if not stripped:
-                        continue
-
-                    # Ignore obvious UI noise
-                    if stripped in UI_TOKENS:
-                        continue
-
-                    # Check if this line is a cash value for money market fund
-                    if is_money_market:
-                        cash_match = CASH_PATTERN.match(stripped)
-                        if cash_match:
-                            cash_value = float(cash_match.group(1).replace(',', ''))
-                            total_cash += cash_value
-                        is_money_market = False  # Reset after checking next line
-
-                    # Case: money market fund with description on same line (e.g., "FDRXX FIDELITY...")
-                    for mmf in MONEY_MARKET_FUNDS:
-                        if stripped.startswith(mmf + ' ') or stripped == mmf:
-                            is_money_market = True
-                            current_symbol = mmf
-                            break
-
-                    # Case: strict symbol-only line (e.g., AVGO, NVDA, FDRXX)
-                    if VALID_SYMBOL_RE.match(stripped):
-                        current_symbol = stripped
-                        # Check if it's a money market fund
-                        if stripped in MONEY_MARKET_FUNDS:
-                            is_money_market = True
-                        continue
-
-                    # Case: exact long-name mapping
-                    if stripped in KNOWN_SYMBOLS:
-                        current_symbol = KNOWN_SYMBOLS[stripped]
-                        continue
-
-                    # Case: long name embedded in line
-                    for name, symbol in KNOWN_SYMBOLS.items():
-                        if name in stripped:
-                            current_symbol = symbol
-                            break
-
-                    # Match lot row
-                    match = lot_pattern.match(stripped)
-                    if match and current_symbol:
-                        (
-                            acquired, term, gain_dollar, gain_pct,
-                            current_value, quantity, avg_cost_basis, cost_basis_total
-                        ) = match.groups()
-
-                        records.append({
-                            "Account": account,
-                            "Symbol": current_symbol,
-                            "Acquired": format_date(acquired),
-                            "Term": term,
-                            "Quantity": float(quantity),
-                            "Average Cost Basis": float(avg_cost_basis),
-                            "Current Value": float(current_value.replace(',', '')),
-                            "Total Gain $": clean_number(gain_dollar),
-                            "Total Gain %": None if gain_pct == "--" else float(gain_pct.strip('%')),
-                        })
-
-        df = pd.DataFrame(records)
-        df.to_csv(output_csv, index=False)
+        records, total_cash, as_of = parse_lot_pdf(pdf_path)
+        write_records(records, output_csv, as_of)
         cash_msg = f" + ${total_cash:,.2f} cash" if total_cash > 0 else ""
-        print(f"✅ Exported {len(df)} rows{cash_msg} to {output_csv}")
+        print(f"✅ Exported {len(records)} rows{cash_msg} to {output_csv}")
 
         return total_cash
 
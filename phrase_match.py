@@ -0,0 +1,89 @@
+"""
+Company-name lookup for the PDF statement parsers.
+
+PhraseMatcher compiles a {phrase: value} mapping into an Aho-Corasick
+automaton, so finding which phrases occur in a line is one pass over its
+characters however many phrases there are. first() answers what the old
+"for phrase in mapping: if phrase in line" loops did: the value of the
+earliest phrase, in mapping order, that occurs anywhere in the line.
+
+Extra phrases can be added in config.py (gitignored) as COMPANY_SYMBOLS;
+with_user_phrases() puts them ahead of a parser's built-in ones.
+"""
+from collections import deque
+
+
+def with_user_phrases(builtin):
+    """builtin preceded by config.COMPANY_SYMBOLS, whose entries take precedence."""
+    try:
+        from config import COMPANY_SYMBOLS
+    except ImportError:
+        COMPANY_SYMBOLS = {}
+    merged = dict(COMPANY_SYMBOLS)
+    for phrase, value in builtin.items():
+        merged.setdefault(phrase, value)
+    return merged
+
+
+class PhraseMatcher:
+    def __init__(self, mapping, ignore_case=False):
+        self.mapping = dict(mapping)
+        self.values = list(self.mapping.values())
+        self.ignore_case = ignore_case
+
+        # Trie of the phrases; first[state] is the lowest phrase index ending there
+        goto = [{}]
+        first = [None]
+        for index, phrase in enumerate(self.mapping):
+            if ignore_case:
+                phrase = phrase.upper()
+            state = 0
+            for char in phrase:
+                if char not in goto[state]:
+                    goto.append({})
+                    first.append(None)
+                    goto[state][char] = len(goto) - 1
+                state = goto[state][char]
+            if first[state] is None:
+                first[state] = index
+
+        # Fold the failure links into the transitions (a DFA), breadth first so
+        # every suffix state is complete before the states that fall back to it
+        delta = [dict(goto[0])] + [None] * (len(goto) - 1)
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            suffix = fail[state]
+            delta[state] = dict(delta[suffix])
+            delta[state].update(goto[state])
+            inherited = first[suffix]
+            if inherited is not None and (first[state] is None or inherited < first[state]):
+                first[state] = inherited
+            for char, child in goto[state].items():
+                fail[child] = delta[suffix].get(char, 0)
+                queue.append(child)
+        self._delta = delta
+        self._first = first
+
+    def first_index(self, text):
+        """Index, in mapping order, of the earliest phrase found in text, or None."""
+        if not text:
+            return None
+        if self.ignore_case:
+            text = text.upper()
+        delta, first = self._delta, self._first
+        state, best = 0, None
+        for char in text:
+            state = delta[state].get(char, 0)
+            found = first[state]
+            if found is not None and (best is None or found < best):
+                if found == 0:
+                    return 0
+                best = found
+        return best
+
+    def first(self, text, default=None):
+        """Value of the earliest phrase, in mapping order, found in text."""
+        index = self.first_index(text)
+        return default if index is None else self.values[index]
@@ -1,26 +1,35 @@
 import csv
+import os
 from dataclasses import dataclass
 from collections import defaultdict
-from dateutil.parser import parse
-import yfinance as yf
 from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-import json
-import pandas as pd
-
+import numpy as np
+from disk_cache import DiskCache
+import downloader
+import downsample
+import export_schemas
+import instrument
+from lot_table import LotTable
+import price_matrix
+import price_provider
+import ticker_store
+
+# pandas and matplotlib are imported inside the methods that use them, so
+# text-only commands do not pay for them at startup.
 
 SPECIAL_STOCKS = ['AAPL']
+# Bump whenever read_csv output changes, to invalidate persisted parses
+PARSER_VERSION = 5
 YEARS_CUTOFF = 0.1
 MONEY_MARKET_FUNDS = ['VMRXX', 'VUSXX', 'SPAXX', 'FDRXX', 'SWVXX', 'FDIC']
 
-def is_valid_date_format(date_str, format_str='%m/%d/%Y'):
-    try:
-        # Try to parse the string according to the format '%m/%d/%Y'
-        datetime.strptime(date_str, format_str)
-        return True
-    except ValueError:
-        # If parsing fails, the string is not in the correct format
-        return False
+# Daily worm values per (lot fingerprint, index, ticker store), extended as new days are asked for
+worm_cache = DiskCache('worms', 2)
+# A stored worm value recomputed on a later run must agree to this relative
+# tolerance, otherwise the price history behind it has changed
+WORM_TOLERANCE = 1e-9
+# Named worm sample frequencies (pandas offset aliases)
+WORM_FREQUENCIES = {'daily': 'B', 'weekly': 'W-WED', 'month-end': 'BME'}
 
 def determine_header_map(header):
     map = {
@@ -50,14 +59,8 @@ def calculate_cagr(start_value, end_value, years):
     #     years = 1
     return ((end_value / start_value) ** (1 / years)) - 1
 
-def is_date(string):
-    try:
-        string = string.strip().rstrip()
-        # Define the expected date format as DD/MM/YYYY
-        datetime.strptime(string, '%m/%d/%Y')
-        return True
-    except ValueError:
-        return False
+def parse_number(cell):
+    return float(cell.strip().replace('$', '').replace(',', ''))
 
 def find_index(expected_map, col):
     for k, v in expected_map.items():
@@ -105,170 +108,44 @@ class StockInfo:
 
 
 class Portfolio:
-    def __init__(self):
+    def __init__(self, ticker_dir=None, provider=None):
+        self.provider = provider or price_provider.default_provider()
+        # The provider's own store unless told otherwise (see price_provider)
+        self.ticker_dir = ticker_dir or self.provider.store_dir
         self.portfolio = {}
-        self.lots = []
+        self.lots = LotTable()
         self.ticker_cache = {}
-        self.stocks = {}
 
     def calculate_weighted_average_cagr(self):
-        lots = self.lots
-        total_weight = 0.0
-        weighted_cagr_sum = 0.0
-
-        for lot in lots:
-            weight = lot.price_paid * lot.qty
-            # self.cagr_weight_per_symbol[lot.symbol] += weight
-            total_weight += weight
-            if lot.cagr:
-                weighted_cagr_sum += lot.cagr * weight
-                # self.cagr_weight_per_symbol[lot.symbol] += lot.cagr * weight
-
-        if total_weight == 0:
-            return 0.0
-        return weighted_cagr_sum / total_weight
-
-    def parse_fidelty_csv(self, file_path):
-        lots = []
-        with open(file_path, 'r') as file:
-            reader = csv.reader(file)
-            header = next(reader)  # Skip the header row
-            map = determine_header_map(header)
-            for row in reader:
-                if row and 'The data and information' in row[0]:
-                    # file ended
-                    break
-                if row[map['Symbol']].strip() == 'QAJDS':
-                    # this represents cash in chase. pass on..
-                    continue
-                symbol = row[map['Symbol']].strip()
-                # date should in in format 08/09/2024
-
-                date = row[map['Date']].strip()
-                if not is_valid_date_format(row[map['Date']].strip(), format_str='%m/%d/%Y') and date != '':
-                    date = convert_date_format(row[map['Date']].strip(), '%d-%b-%Y', '%m/%d/%Y')
-
-
-                qty = float(row[map['Quantity']].strip())
-                price_paid = None
-                if 'Price Paid' in map:
-                    price_paid = float(row[map['Price Paid']].strip())
-                cleaned_value_str = row[map['Value']].strip().replace('$', '').replace(',', '')
-                value = float(cleaned_value_str)
-                cleaned_gain_str = row[map['Total Gain']].strip().replace('$', '').replace(',', '')
-                total_gain = float(cleaned_gain_str)
-
-                price_paid = self.get_stock_price(symbol, convert_date_format(date, input_format='%m/%d/%Y'), cached=True)
-                total_gain = value - (price_paid * qty)
-                days_gain = None
-                # not all files have days gain
-                if 'Day Gain' in map:
-                    days_gain = float(row[map['Day Gain']].strip())
-
-                total_gain_percent = None
-                if 'Total Gain %' in map and row[map['Total Gain %']]:
-                    total_gain_percent = float(row[map['Total Gain %']].strip())
-
-                # Calculate number of years from acquisition date to today
-                acquisition_date = parse(date)
-                current_date = datetime.now()
-                years_held = (current_date - acquisition_date).days / 365.25
-
-                # Calculate CAGR only if held long enough
-                if years_held < YEARS_CUTOFF:
-                    cagr = None
-                else:
-                    start_value = qty * price_paid
-                    end_value = value
-                    cagr = calculate_cagr(start_value, end_value, years_held)
-
-                lot = LotInfo(symbol, date, qty, price_paid, days_gain, total_gain, total_gain_percent,
-                              value, cagr)
-                lots.append(lot)
-        return lots, 0.0
-
-    def parse_grant_csv(self, file_path):
-        lots = []
-        with open(file_path, 'r') as file:
-            reader = csv.reader(file)
-            header = next(reader)  # Skip the header row
-            map = determine_header_map(header)
-            for row in reader:
-                if row and row[0].startswith('Overall Total'):
-                    # file ended
-                    break
-                if row[map['Symbol']].strip() == 'QAJDS':
-                    # this represents cash in chase. pass on..
-                    continue
-                symbol = row[map['Symbol']].strip()
-                # date should in in format 08/09/2024
-
-                date = row[map['Date']].strip()
-                if not is_valid_date_format(row[map['Date']].strip(), format_str='%m/%d/%Y') and date != '':
-                    date = convert_date_format(row[map['Date']].strip(), '%d-%b-%Y', '%m/%d/%Y')
-
-
-                qty = float(row[map['Quantity']].strip())
-                price_paid = None
-                if 'Price Paid' in map:
-                    price_paid = float(row[map['Price Paid']].strip())
-                cleaned_value_str = row[map['Value']].strip().replace('$', '').replace(',', '')
-                value = float(cleaned_value_str)
-                cleaned_gain_str = row[map['Total Gain']].strip().replace('$', '').replace(',', '')
-                total_gain = float(cleaned_gain_str)
-
-                price_paid = self.get_stock_price(symbol, convert_date_format(date, input_format='%m/%d/%Y'), cached=True)
-                total_gain = value - (price_paid * qty)
-                days_gain = None
-                # not all files have days gain
-                if 'Day Gain' in map:
-                    days_gain = float(row[map['Day Gain']].strip())
-
-                total_gain_percent = None
-                if 'Total Gain %' in map:
-                    total_gain_percent = float(row[map['Total Gain %']].strip())
-
-                # Calculate number of years from acquisition date to today
-                acquisition_date = parse(date)
-                current_date = datetime.now()
-                years_held = (current_date - acquisition_date).days / 365.25
-
-                # Calculate CAGR only if held long enough
-                if years_held < YEARS_CUTOFF:
-                    cagr = None
-                else:
-                    start_value = qty * price_paid
-                    end_value = value
-                    cagr = calculate_cagr(start_value, end_value, years_held)
-
-                lot = LotInfo(symbol, date, qty, price_paid, days_gain, total_gain, total_gain_percent,
-                              value, cagr)
-                lots.append(lot)
-                # print(lot)
-        return lots, 0.0
+        from holdings import weighted_average_cagr
+        return weighted_average_cagr(self.lots.price_paid, self.lots.qty, self.lots.cagr)
 
+    @instrument.span('parse_csv')
     def parse_csv(self, file_path, CURRENT_DATE, fetch_AAPL_price=True):
-        if 'Sellable' in file_path or 'chase' in file_path:
-            return self.parse_grant_csv(file_path, )
-        elif 'fidelity' in file_path:
-            return self.parse_fidelty_csv(file_path, )
-        lots = []
+        """Parse a brokerage export into a priced LotTable: read_csv(), then price_lots()."""
+        lots, cash_amount, schema = self.read_csv(file_path)
+        self.price_lots(lots, schema, CURRENT_DATE, fetch_AAPL_price)
+        return lots, cash_amount
+
+    def read_csv(self, file_path):
+        """
+        Read a brokerage export in one pass into a LotTable holding the
+        figures as the file gives them. The layout is detected from the
+        header (see export_schemas). Returns (lots, cash, schema name).
+        """
         cash_amount = 0.0
         current_symbol = None
+        symbols, days, qtys, paid, values, gains, day_gains, gain_pcts = ([] for _ in range(8))
         with open(file_path, 'r') as file:
             reader = csv.reader(file)
-            header = None
-            while True:
-                header = next(reader)
-                is_ssr_format_csv = header and header[0] and header[0].startswith('Symbol') and header[1] and header[1].startswith('Last Price $')
-                is_os_format_csv = header and header[0] and header[0].startswith('Symbol') and header[1] and header[1].startswith('Qty #')
-                if is_ssr_format_csv or is_os_format_csv:
-                    break
-
-            # header = next(reader)  # Skip the header row
+            schema, header = export_schemas.detect_schema(reader, file_path)
             map = determine_header_map(header)
             for row in reader:
-                if row and row[0] == 'CASH':
+                if not row:
+                    continue
+                if schema.is_end_of_data(row):
+                    break
+                if schema.cash_row and row[0] == schema.cash_row:
                     # Extract cash amount from the row
                     for i in range(len(row) - 1, -1, -1):
                         try:
@@ -278,115 +155,142 @@ class Portfolio:
                         except:
                             continue
                     break
-                if is_date(row[0]) or is_date(row[map['Date']].strip()):
-                    # try:
-                        date = row[map['Date']].strip()
-
-                        qty = float(row[map['Quantity']].strip())
-                        price_paid = float(row[map['Price Paid']].strip())
-                        if CURRENT_DATE:
-                            lot_current_price = self.get_stock_price(current_symbol,
-                                                                 convert_date_format(CURRENT_DATE, input_format='%m/%d/%Y'),
-                                                                 cached=True)
-                            value = lot_current_price * qty
-                        else:
-                            value = float(row[map['Value']].strip())
-                        total_gain = float(row[map['Total Gain']].strip())
-                        if fetch_AAPL_price and current_symbol == 'AAPL':
-                            price_paid = self.get_stock_price(current_symbol, convert_date_format(date), cached=True)
-                            total_gain = value - (price_paid * qty)
-                        days_gain = None
-                        # not all files have days gain
-                        if 'Day Gain' in map:
-                            days_gain = float(row[map['Day Gain']].strip())
-
-                        total_gain_percent = float(row[map['Total Gain %']].strip())
-
-                        # Calculate number of years from acquisition date to today
-                        acquisition_date = parse(date)
-                        current_date = datetime.now()
-                        years_held = (current_date - acquisition_date).days / 365.25
-
-                        if years_held < YEARS_CUTOFF:
-                            cagr = None
-                        else:
-                            # Calculate CAGR
-                            start_value = qty * price_paid
-                            end_value = value
-
-                            cagr = calculate_cagr(start_value, end_value, years_held)
-
-
-                        lot = LotInfo(current_symbol, date, qty, price_paid, days_gain, total_gain, total_gain_percent,
-                                      value, cagr)
-                        lots.append(lot)
-                    # except ValueError as e:
-                    #     print(f"Error parsing row: {row} - {e}")
-                else:
-                    current_symbol = row[0].strip()
-        return lots, cash_amount
 
-    def generate_worm(self, index=[], start_date=None, end_date='08/10/2024'):
-        self.generate_worm_single(start_date=start_date, end_date=end_date)
+                if schema.symbol_rows:
+                    acquired = (export_schemas.parse_date(row[map['Date']].strip()) or
+                                export_schemas.parse_date(row[0].strip()))
+                    if not acquired:
+                        current_symbol = row[0].strip()
+                        continue
+                    symbol = current_symbol
+                else:
+                    symbol = row[map['Symbol']].strip()
+                    if symbol in schema.skip_symbols:
+                        continue
+                    date = row[map['Date']].strip()
+                    acquired = export_schemas.parse_date(date, schema.date_formats)
+                    if not acquired:
+                        raise ValueError(f"Unrecognized acquisition date {date!r} in {file_path}")
+
+                symbols.append(symbol)
+                days.append(acquired[1])
+                qtys.append(parse_number(row[map['Quantity']]))
+                paid.append(parse_number(row[map['Price Paid']]) if 'Price Paid' in map else None)
+                values.append(parse_number(row[map['Value']]))
+                gains.append(parse_number(row[map['Total Gain']]))
+                # not all files have days gain
+                day_gains.append(parse_number(row[map['Day Gain']]) if 'Day Gain' in map else None)
+                gain_pct = row[map['Total Gain %']].strip() if 'Total Gain %' in map else ''
+                gain_pcts.append(float(gain_pct) if gain_pct else None)
+
+        lots = LotTable.from_columns(symbols, days, qty=qtys, price_paid=paid, days_gain=day_gains,
+                                     total_gain=gains, total_gain_percent=gain_pcts, value=values)
+        instrument.count('parse_csv.lots', len(lots))
+        return lots, cash_amount, schema.name
+
+    @instrument.span('price_lots')
+    def price_lots(self, lots, schema, CURRENT_DATE, fetch_AAPL_price=True):
+        """
+        Fill in the parts of a read export (see read_csv; schema is its name)
+        that come from the ticker cache, in place: CURRENT_DATE values,
+        market cost bases and CAGR. Prices are looked up per symbol for all
+        lots at once.
+        """
+        schema = export_schemas.schema_named(schema)
+        if schema.symbol_rows and CURRENT_DATE:
+            current_day = ticker_store.iso_to_day(convert_date_format(CURRENT_DATE))
+            lots.value = self.lot_prices(lots, np.full(len(lots), current_day)) * lots.qty
+
+        if schema.market_cost_basis:
+            self.use_market_cost_basis(lots, lots.symbols)
+        elif fetch_AAPL_price:
+            self.use_market_cost_basis(lots)
+
+        # Years from acquisition date to today; CAGR only for lots held long enough
+        today = datetime.now().date().toordinal() - export_schemas.EPOCH_ORDINAL
+        years_held = (today - lots.day.astype(np.int64)) / 365.25
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cagr = (lots.value / (lots.qty * lots.price_paid)) ** (1 / years_held) - 1
+        lots.cagr = np.where(years_held < YEARS_CUTOFF, np.nan, cagr)
+
+    def lot_prices(self, lots, days, mask=None):
+        """
+        Cached close on or after days[i] for each lot i of a LotTable (only
+        where mask is set), with one batched lookup per symbol. Other entries
+        are NaN.
+        """
+        selected = np.arange(len(lots)) if mask is None else np.flatnonzero(mask)
+        order = selected[np.argsort(lots.symbol_code[selected], kind='stable')]
+        codes = lots.symbol_code[order]
+        prices = np.full(len(lots), np.nan)
+        for rows in np.split(order, np.flatnonzero(np.diff(codes)) + 1):
+            if len(rows):
+                prices[rows] = self.prices_asof(lots.symbols[lots.symbol_code[rows[0]]], days[rows])
+        return prices
+
+    @instrument.span('worm')
+    def generate_worm(self, index=[], start_date=None, end_date='08/10/2024', frequency='daily', max_points=None):
+        """
+        Plot the portfolio worm and one counterfactual worm per index.
+        frequency picks the sample dates (see worm_dates); max_points, if
+        set, downsamples each curve for display only.
+        """
+        import matplotlib.pyplot as plt
+        weekdays = self.worm_dates(start_date, end_date, frequency)
+        query_days = ticker_store.to_days(weekdays)
+        values, aapl_values = self.worm_series(None, query_days)
+        self.plot_worm(weekdays, values, aapl_values, None, max_points)
         for ind in index:
-            self.generate_worm_single(index=ind, start_date=start_date, end_date=end_date)
+            # Through worm_cache like the portfolio worm, so only new days are computed
+            self.plot_worm(weekdays, self.worm_series(ind, query_days)[0], aapl_values, ind, max_points)
         plt.show()
 
-    def generate_worm_single(self, index=None, start_date=None, end_date='08/10/2024'):
-        all_dates = set([l.date for l in self.lots] + [end_date])
-        starting_date = '01/01/2019'
-
-        # Generate the range of weekdays and format them as 'MM/DD/YYYY'
-        weekdays = pd.bdate_range(start=start_date, end=pd.to_datetime(end_date, format='%m/%d/%Y'))
-
-        # Filter only Wednesdays (where Wednesday is day number 2 in pandas, starting from Monday=0)
-        # wednesdays = weekdays[weekdays.weekday == 2].strftime('%m/%d/%Y').tolist()
-
-        # all_dates = wednesdays
-        all_dates = weekdays.strftime('%m/%d/%Y').tolist()
-
-        # all_dates = set([l.date for l in self.lots])
-        date_objects = [datetime.strptime(date, "%m/%d/%Y") for date in all_dates]
-        date_objects.sort()
-        all_dates = date_objects
-        # all_dates = [date.strftime("%m/%d/%Y") for date in date_objects]
-        values = []
-        dates = []
-
-        for date in all_dates:
-
-            if start_date and date < datetime.strptime(start_date, '%m/%d/%Y'):
-                continue
-            value = 0
-            aapl_val = 0.0
-            for l in self.lots:
-                if l.symbol in []:
-                    continue
-                # if datetime.strptime(date, '%m/%d/%Y') >= datetime.strptime(l.date, '%m/%d/%Y'):
-                if date >= datetime.strptime(l.date, '%m/%d/%Y'):
-                    cur_price = self.get_stock_price(l.symbol, convert_date_format(date.strftime("%m/%d/%Y")),
-                                                     cached=True)
-                    cur_val = cur_price * l.qty
-                    if index:
-                        index_buy_price = self.get_stock_price(index, convert_date_format(l.date), cached=True)
-                        index_cur_price = self.get_stock_price(index, convert_date_format(date.strftime("%m/%d/%Y")), cached=True)
-                        cur_val = (l.price_paid * l.qty) / index_buy_price * index_cur_price
-
-
-                    # cur_val = l.price_paid * l.qty
-                    if l.symbol == 'AAPL':
-                        aapl_val += l.price_paid * l.qty
-                    # cur_price = self.get_stock_price('VGT', convert_date_format(date.strftime("%m/%d/%Y")), end_date='08/10/2024', cached=True)
-                    value += cur_val
-
+    def generate_worm_single(self, index=None, start_date=None, end_date='08/10/2024', frequency='daily',
+                             max_points=None):
+        weekdays = self.worm_dates(start_date, end_date, frequency)
+        values, aapl_values = self.worm_series(index, ticker_store.to_days(weekdays))
+        self.plot_worm(weekdays, values, aapl_values, index, max_points)
+
+    @staticmethod
+    def worm_dates(start_date=None, end_date='08/10/2024', frequency='daily'):
+        """
+        Sample dates of a worm between start_date and end_date ('MM/DD/YYYY').
+        frequency is 'daily' (business days), 'weekly' (Wednesdays),
+        'weekly-<day>' (e.g. 'weekly-fri'), 'month-end' (last business day of
+        each month), any other pandas offset alias, or a list of dates.
+        Only these dates are priced.
+        """
+        import pandas as pd
+        end = pd.to_datetime(end_date, format='%m/%d/%Y')
+        if isinstance(frequency, str):
+            freq = WORM_FREQUENCIES.get(frequency, frequency)
+            if frequency.startswith('weekly-'):
+                freq = 'W-' + frequency.split('-', 1)[1].upper()
+            weekdays = pd.bdate_range(start=start_date, end=end, freq=freq)
+        else:
+            weekdays = pd.DatetimeIndex(sorted(pd.to_datetime(list(frequency))))
+            weekdays = weekdays[weekdays <= end]
+
+        if start_date:
+            weekdays = weekdays[weekdays >= datetime.strptime(start_date, '%m/%d/%Y')]
+        return weekdays
+
+    @instrument.span('plot_worm')
+    def plot_worm(self, weekdays, values, aapl_values, index=None, max_points=None):
+        import matplotlib.pyplot as plt
+        dates = list(weekdays.to_pydatetime())
+        for date, value, aapl_val in zip(dates, values, aapl_values):
             print(f'Portfolio value {date} as of {value} aapl:{aapl_val}')
-            dates.append(date)
-            values.append(value)
 
         label = index
         if not index:
             label = 'Shehla/Osman'
 
+        if max_points:
+            keep = downsample.lttb_indices(ticker_store.to_days(weekdays), values, max_points)
+            dates = [dates[i] for i in keep]
+            values = np.asarray(values)[keep]
+
         plt.plot(dates, values, label=label)
         plt.legend()
 
@@ -401,34 +305,166 @@ class Portfolio:
 
         # Show the plot
         # plt.show()
-            # print('-----> ', date, value)
+
+    def counterfactual(self, benchmarks=None, start_date=None, end_date=None, strict=False, frequency='daily'):
+        """
+        Dates x benchmarks DataFrame of what the lots would be worth had every
+        purchase gone into each benchmark instead, for all benchmarks at once.
+        benchmarks defaults to every symbol in the ticker cache and end_date to
+        today. Missing prices give NaN, or raise the cached-lookup error when
+        strict.
+        """
+        import pandas as pd
+        if benchmarks is None:
+            benchmarks = ticker_store.cached_symbols(self.ticker_dir)
+        benchmarks = list(benchmarks)
+        weekdays = self.worm_dates(start_date, end_date or datetime.today().strftime('%m/%d/%Y'), frequency)
+        query_days = ticker_store.to_days(weekdays)
+        lot_days = self.lots.day
+        buy_prices = np.column_stack([self.cached_prices(b, lot_days) for b in benchmarks] or
+                                     [np.empty(len(lot_days))])[:, :len(benchmarks)]
+        cur_prices = np.column_stack([self.cached_prices(b, query_days) for b in benchmarks] or
+                                     [np.empty(len(query_days))])[:, :len(benchmarks)]
+        if strict and len(query_days) and len(lot_days):
+            needed_lots = lot_days <= query_days.max()
+            needed_days = query_days >= lot_days.min()
+            price_matrix.require_prices(buy_prices, needed_lots[:, None], benchmarks, lot_days)
+            price_matrix.require_prices(cur_prices, needed_days[:, None], benchmarks, query_days)
+        values = price_matrix.counterfactual_values(query_days, lot_days, self.lots.cost(), buy_prices, cur_prices)
+        return pd.DataFrame(values, index=weekdays, columns=benchmarks)
+
+    def rank_counterfactuals(self, frame):
+        """
+        Benchmarks of a counterfactual() frame ranked by final value, with the
+        gain over the cost of the lots bought by the last date.
+        """
+        import pandas as pd
+        invested = 0.0
+        if len(frame):
+            last_day = ticker_store.to_days(frame.index[-1:])[0]
+            invested = float(self.lots.cost()[self.lots.day <= last_day].sum())
+        rows = price_matrix.rank_final_values(frame.to_numpy(), list(frame.columns), invested)
+        return pd.DataFrame(rows, columns=['Benchmark', 'Final value', 'Gain', 'Gain %']).set_index('Benchmark')
+
+    def worm_series(self, index, query_days):
+        """
+        (values, aapl_values) of the worm on query_days (days since the epoch).
+        Days already computed for this set of lots, index and ticker store
+        are read from worm_cache; only the others are computed and then stored. The latest
+        stored day is recomputed as a check, and a mismatch (re-adjusted
+        price history) recomputes every day.
+        """
+        key = (self.lots.fingerprint(), index, os.path.abspath(self.ticker_dir))
+        entry = worm_cache.get(key)
+        stored_days = entry['days'] if entry else np.array([], dtype=np.int64)
+        todo = ~np.isin(query_days, stored_days)
+        check = np.flatnonzero(~todo)[-1:]
+        todo[check] = True
+        if not todo.any():
+            return self.stored_worm(entry, query_days)
+
+        values, aapl_values = self.compute_worm(index, query_days[todo])
+        if len(check):
+            stored_value = self.stored_worm(entry, query_days[check])[0]
+            if not np.allclose(values[np.sum(todo[:check[0]])], stored_value, rtol=WORM_TOLERANCE):
+                entry = None
+                todo[:] = True
+                values, aapl_values = self.compute_worm(index, query_days)
+
+        new = {'days': query_days[todo], 'values': values, 'aapl': aapl_values}
+        if entry:
+            new = {name: np.concatenate([entry[name], new[name]]) for name in new}
+            days, first = np.unique(new['days'][::-1], return_index=True)
+            new = {name: column[::-1][first] for name, column in new.items()}
+        worm_cache.put(key, new)
+        return self.stored_worm(new, query_days)
+
+    @staticmethod
+    def stored_worm(entry, query_days):
+        at = np.searchsorted(entry['days'], query_days)
+        return entry['values'][at], entry['aapl'][at]
+
+    def compute_worm(self, index, query_days):
+        """
+        (values, aapl_values) of the worm on query_days, from the ticker cache.
+        Holdings are accumulated per symbol (price_matrix.held_amounts), so
+        the cost grows with days x symbols rather than days x lots.
+        """
+        lot_days = self.lots.day
+        lot_cost = self.lots.cost()
+        held_lots = lot_days <= (np.max(query_days) if len(query_days) else np.iinfo(np.int32).min)
+        holding_days = query_days >= (np.min(lot_days) if len(lot_days) else np.iinfo(np.int32).max)
+
+        if index:
+            index_buy = self.cached_prices(index, lot_days)
+            index_cur = self.cached_prices(index, query_days)
+            price_matrix.require_series(index, index_buy, held_lots, lot_days)
+            price_matrix.require_series(index, index_cur, holding_days, query_days)
+            values = price_matrix.counterfactual_values(query_days, lot_days, lot_cost, index_buy[:, None],
+                                                        index_cur[:, None])[:, 0]
+        else:
+            n_symbols = len(self.lots.symbols)
+            matrix = np.column_stack([self.cached_prices(sym, query_days) for sym in self.lots.symbols] or
+                                     [np.empty((len(query_days), 0))])
+            shares = price_matrix.held_amounts(query_days, lot_days, self.lots.qty, self.lots.symbol_code,
+                                               n_symbols)
+            held = price_matrix.held_amounts(query_days, lot_days, np.ones(len(lot_days)),
+                                             self.lots.symbol_code, n_symbols) > 0
+            price_matrix.require_prices(matrix, held, self.lots.symbols, query_days)
+            values = np.where(held, shares * matrix, 0.0).sum(axis=1)
+
+        is_aapl = self.lots.symbol_mask('AAPL')
+        aapl_values = price_matrix.held_amounts(query_days, lot_days[is_aapl], lot_cost[is_aapl],
+                                                np.zeros(int(is_aapl.sum()), dtype=np.intp), 1)[:, 0]
+        return values, aapl_values
+
+    def cached_prices(self, symbol, days):
+        """Cached close on or after each day (days since the epoch), NaN where the cache has none."""
+        if symbol in MONEY_MARKET_FUNDS:
+            return np.ones(len(days))
+        if symbol not in self.ticker_cache:
+            self.cache_ticker_data(symbol)
+        if symbol not in self.ticker_cache:
+            return np.full(len(days), np.nan)
+        return self.ticker_cache[symbol].asof_many(days)
+
+    def prices_asof(self, symbol, dates):
+        """
+        Batch version of get_stock_price(cached=True): the close on or after
+        each date ('YYYY-MM-DD' strings, datetimes or epoch days).
+        """
+        days = ticker_store.to_days(dates)
+        prices = self.cached_prices(symbol, days)
+        price_matrix.require_series(symbol, prices, np.ones(len(days), dtype=bool), days)
+        return prices
+
+    def get_price_matrix(self, symbols, dates):
+        """Date x symbol DataFrame of cached close prices, NaN where the cache has none."""
+        import pandas as pd
+        query_days = ticker_store.to_days(dates)
+        return pd.DataFrame({sym: self.cached_prices(sym, query_days) for sym in symbols},
+                            index=pd.DatetimeIndex(dates), columns=list(symbols))
 
     def cache_ticker_data(self, symbol):
-        try:
-            with open(f'ticker_data/{symbol}.json', 'r') as fd:
-                self.ticker_cache[symbol] = json.load(fd)
-        except FileNotFoundError:
-            return
+        instrument.count('ticker_store.loads')
+        series = ticker_store.load(symbol, self.ticker_dir)
+        if series is not None:
+            self.ticker_cache[symbol] = series
 
-    def write_ticker_cache(self):
-        for sym, data in self.ticker_cache.items():
-            with open(f'ticker_data/{sym}.json', 'w') as fd:
-                json.dump(data, fd, indent=4)
+    def write_ticker_cache(self, symbols=None):
+        for sym, series in self.ticker_cache.items():
+            if symbols is None or sym in symbols:
+                ticker_store.save(sym, series, self.ticker_dir)
 
+    @instrument.span('plot_timeline')
     def plot_timeline(self):
-        total_cost = 0
-        dates = []
-        dates_special = []
-        values = []
-        values_special = []
-        for l in self.lots:
-            total_cost += l.qty * l.price_paid
-            if l.symbol in SPECIAL_STOCKS:
-                dates_special.append(datetime.strptime(l.date, '%m/%d/%Y'))
-                values_special.append(l.qty * l.price_paid)
-            else:
-                dates.append(datetime.strptime(l.date, '%m/%d/%Y'))
-                values.append(l.qty * l.price_paid)
+        import matplotlib.pyplot as plt
+        costs = self.lots.cost()
+        total_cost = costs.sum()
+        lot_dates = self.lots.day.astype('datetime64[D]')
+        special = self.lots.symbol_mask(SPECIAL_STOCKS)
+        dates, values = lot_dates[~special], costs[~special]
+        dates_special, values_special = lot_dates[special], costs[special]
 
         print(f'Total cost basis: {total_cost:.2f}')
 
@@ -447,53 +483,86 @@ class Portfolio:
         # Show the plot
         plt.show()
 
+    @instrument.span('get_stock_price')
     def get_stock_price(self, symbol, date, itr=5, end_date=None, cached=False):
         # Money market funds always trade at $1.00
         if symbol in MONEY_MARKET_FUNDS:
             return 1.0
 
         if cached:
-            if symbol not in self.ticker_cache:
+            if symbol in self.ticker_cache:
+                instrument.count('price.ticker_cache.hit')
+            else:
+                instrument.count('price.ticker_cache.miss')
                 self.cache_ticker_data(symbol)
             return self.get_stock_price_cached(symbol, date, itr, end_date)
         else:
             return self.get_stock_price_live(symbol, date, itr, end_date)
 
     def get_stock_price_cached(self, symbol, date, itr=10, end_date=None):
-        if itr <= 0:
-            raise ValueError(f"Could not find cached price for {symbol} on or after {date} (checked 10 days ahead). Cache may need refresh.")
-        if date not in self.ticker_cache[symbol]:
-            return self.get_stock_price_cached(symbol, add_one_day(date), itr - 1)
-        return self.ticker_cache[symbol][date]
+        # Binary search for the first cached close on or after date, looking
+        # at most itr calendar days ahead to skip weekends and holidays.
+        price = self.ticker_cache[symbol].asof(ticker_store.iso_to_day(date), itr)
+        if price is None:
+            raise price_matrix.missing_price_error(symbol, date)
+        return price
+
+    def download_history(self, symbol, start, end):
+        """Daily closes from the price provider for [start, end) ('YYYY-MM-DD') as {'YYYY-MM-DD': close}."""
+        return downloader.fetch_with_retries(self.provider, symbol, start, end)
+
+    def download_histories(self, jobs):
+        """
+        Download {symbol: (start, end)} with one provider.get_range() per
+        distinct range. Returns {symbol: history} for the symbols that could
+        be fetched.
+        """
+        ranges = {}
+        for sym, (start, end) in jobs.items():
+            ranges.setdefault((start, end), []).append(sym)
+        histories = {}
+        for (start, end), symbols in ranges.items():
+            histories.update(self.provider.get_range(symbols, start, end))
+        return histories
+
+    def merge_history(self, symbol, history, replace=False):
+        """Merge a downloaded {'YYYY-MM-DD': close} history into ticker_cache."""
+        if replace or symbol not in self.ticker_cache:
+            self.ticker_cache[symbol] = ticker_store.PriceSeries.from_dict(history)
+        else:
+            self.ticker_cache[symbol].update(history)
 
     def get_stock_price_live(self, symbol, date, itr=5, end_date=None):
         if not itr:
             return None
 
-        if symbol not in self.stocks:
-            self.stocks[symbol] = yf.Ticker(symbol)
-        stock = self.stocks[symbol]
         if end_date:
             end_d = convert_date_format(end_date)
         else:
             end_d = add_one_day(date)
 
-        hist = stock.history(start=date, end=end_d)
-
-        if not hist.empty:
-            if symbol not in self.ticker_cache:
-                self.ticker_cache[symbol] = {}
-            if not end_d:
-                self.ticker_cache[symbol][date] = hist['Close'].iloc[0]
-                return hist['Close'].iloc[0]
-            else:
-                for i in range(len(hist)):
-                    ts = str(hist.index[i])
-                    ts = ts.split()[0]
-                    self.ticker_cache[symbol][ts] = hist['Close'].iloc[i]
+        instrument.count('network.requests')
+        hist = self.provider.history(symbol, date, end_d)
 
+        if hist:
+            self.merge_history(symbol, hist)
+            return hist[min(hist)]
         else:
+            # No close that day (weekend, holiday): try the next one
+            instrument.count('price.live_hops')
             return self.get_stock_price(symbol, add_one_day(date), itr - 1)
 
+    def use_market_cost_basis(self, lots, symbols=('AAPL',)):
+        """
+        Re-base price_paid on the cached close at each lot's acquisition date for
+        the given symbols of a LotTable, as parse_csv(fetch_AAPL_price=True) does
+        while parsing.
+        """
+        rebased = lots.symbol_mask(symbols)
+        if not rebased.any():
+            return
+        lots.price_paid[rebased] = self.lot_prices(lots, lots.day, rebased)[rebased]
+        lots.total_gain[rebased] = lots.value[rebased] - (lots.price_paid[rebased] * lots.qty[rebased])
+
     def add_lots(self, l):
-        self.lots += l
\ No newline at end of file
+        self.lots.extend(l)
\ No newline at end of file
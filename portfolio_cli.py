@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Command-line entry point for the portfolio tools.
+
+    python portfolio_cli.py gains [--date MM/DD/YYYY] [--no-chart] [--no-refresh] [--no-pdf] [CSV ...]
+    python portfolio_cli.py worm [--start MM/DD/YYYY] [--end MM/DD/YYYY] [--index ^GSPC,^IXIC]
+                                 [--frequency weekly] [--max-points N] [CSV ...]
+    python portfolio_cli.py refresh [--full] [CSV ...]
+    python portfolio_cli.py compare -f DIRECTORY [-b QQQ,SPY]
+    python portfolio_cli.py parse-1099b [DIRECTORY]
+    python portfolio_cli.py verify-cagr [SYMBOL ...]
+    python portfolio_cli.py serve [--port 8765] [CSV ...]
+    python portfolio_cli.py query {status,holdings,cagr,worm,counterfactual} [NAME=VALUE ...] [--json]
+
+Every subcommand takes --profile, which prints the time spent in each
+pipeline phase and the cache and network counters afterwards (see
+instrument.py); --trace FILE also writes the spans as a Chrome trace.
+
+CSV arguments default to the PATHS list of the script behind each command.
+Subcommands import their modules only when they run, and charts pull in
+matplotlib only when drawn, so `gains --no-chart` starts without pandas,
+matplotlib or pdfplumber. bench_imports.py keeps an eye on that.
+"""
+import argparse
+import sys
+
+
+# Modules each subcommand imports when it runs (used by bench_imports.py)
+COMMAND_MODULES = {
+    'gains': ['gains'],
+    'worm': ['worms'],
+    'refresh': ['cache_stocks', 'gains'],
+    'compare': ['portfolio_comp'],
+    'parse-1099b': ['parse_1099b'],
+    'verify-cagr': ['verify_cagr_simple'],
+    'serve': ['portfolio_server'],
+    'query': [],
+}
+
+
+def run_gains(args):
+    import gains
+    gains.main(args.paths or gains.PATHS, current_date=args.date, refresh=not args.no_refresh,
+               chart=not args.no_chart, pdfs=[] if args.no_pdf else gains.PDF_EXPORTS)
+
+
+def run_worm(args):
+    import worms
+    index = [i.strip() for i in args.index.split(',') if i.strip()]
+    worms.main(args.paths or worms.PATHS, start_date=args.start, end_date=args.end, index=index,
+               frequency=args.frequency, max_points=args.max_points)
+
+
+def run_refresh(args):
+    from cache_stocks import refresh_stock_data
+    if args.paths:
+        paths = args.paths
+    else:
+        from gains import PATHS as paths
+    refresh_stock_data(paths, incremental=not args.full)
+
+
+def run_compare(args):
+    import portfolio_comp
+    portfolio_comp.main(['-f', args.directory, '-b', args.benchmark])
+
+
+def run_parse_1099b(args):
+    import parse_1099b
+    parse_1099b.main(args.directory or parse_1099b.DEFAULT_DIRECTORY)
+
+
+def run_verify_cagr(args):
+    import verify_cagr_simple
+    verify_cagr_simple.main(args.symbols)
+
+
+def run_serve(args):
+    import portfolio_server
+    if args.paths:
+        paths = args.paths
+    else:
+        from gains import PATHS as paths
+    portfolio_server.serve(paths, port=args.port)
+
+
+def print_rows(rows):
+    """Rows of a query result (dicts with the same keys) as an aligned table."""
+    columns = list(rows[0])
+    cells = [[format_cell(row[col]) for col in columns] for row in rows]
+    widths = [max(len(col), *(len(line[i]) for line in cells)) for i, col in enumerate(columns)]
+    print('  '.join(col.rjust(width) for col, width in zip(columns, widths)))
+    for line in cells:
+        print('  '.join(cell.rjust(width) for cell, width in zip(line, widths)))
+
+
+def format_cell(value):
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return f'{value:,.4f}' if abs(value) < 10 else f'{value:,.2f}'
+    return str(value)
+
+
+def run_query(args):
+    # A thin client: only the standard library, so answers come back in milliseconds
+    import json
+    from urllib.error import HTTPError, URLError
+    from urllib.parse import urlencode
+    from urllib.request import urlopen
+    params = dict(param.split('=', 1) for param in args.params)
+    url = f'http://127.0.0.1:{args.port}/{args.query}' + ('?' + urlencode(params) if params else '')
+    try:
+        with urlopen(url, timeout=args.timeout) as response:
+            result = json.load(response)
+    except HTTPError as e:
+        print(f'Error: {json.load(e).get("error", e)}')
+        return 1
+    except URLError as e:
+        print(f'Could not reach the portfolio server on port {args.port} ({e.reason}); start it with `serve`')
+        return 1
+
+    rows = result.pop('rows', None)
+    if args.json or not rows:
+        if rows is not None:
+            result['rows'] = rows
+        print(json.dumps(result, indent=2))
+        return 0
+    print_rows(rows)
+    for key, value in result.items():
+        print(f'{key}: {format_cell(value) if not isinstance(value, (dict, list)) else json.dumps(value)}')
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='portfolio', description='Portfolio reports and price cache tools')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--profile', action='store_true', help='Print per-phase timings and cache counters')
+    common.add_argument('--trace', metavar='FILE', help='With --profile, also write the spans as a JSON trace')
+
+    gains = commands.add_parser('gains', parents=[common], help='Holdings, gains and CAGR report')
+    gains.add_argument('paths', nargs='*', help='Brokerage exports (default: gains.PATHS)')
+    gains.add_argument('--date', help='Valuation date MM/DD/YYYY (default: most recent working day)')
+    gains.add_argument('--no-chart', action='store_true', help='Print the report only')
+    gains.add_argument('--no-refresh', action='store_true', help='Use the ticker cache as it is')
+    gains.add_argument('--no-pdf', action='store_true', help='Skip converting the Fidelity PDF statements')
+    gains.set_defaults(func=run_gains)
+
+    worm = commands.add_parser('worm', parents=[common], help='Portfolio value over time against indexes')
+    worm.add_argument('paths', nargs='*', help='Brokerage exports (default: worms.PATHS)')
+    worm.add_argument('--start', default='01/01/2019', help='First date MM/DD/YYYY')
+    worm.add_argument('--end', help='Last date MM/DD/YYYY (default: today)')
+    worm.add_argument('--index', default='^GSPC,^IXIC,^DJI', help='Comma-separated indexes to compare against')
+    worm.add_argument('--frequency', default='daily',
+                      help="daily, weekly, weekly-<day>, month-end or a pandas offset alias")
+    worm.add_argument('--max-points', type=int, help='Downsample each curve to this many points for display')
+    worm.set_defaults(func=run_worm)
+
+    refresh = commands.add_parser('refresh', parents=[common], help='Bring the ticker cache up to date')
+    refresh.add_argument('paths', nargs='*', help='Brokerage exports (default: gains.PATHS)')
+    refresh.add_argument('--full', action='store_true', help='Re-download whole histories')
+    refresh.set_defaults(func=run_refresh)
+
+    compare = commands.add_parser('compare', parents=[common], help='Bought transactions against benchmarks')
+    compare.add_argument('-f', '--directory', required=True, help='Directory of transaction CSV files')
+    compare.add_argument('-b', '--benchmark', default='QQQ', help='Comma-separated benchmark symbols')
+    compare.set_defaults(func=run_compare)
+
+    parse_1099b = commands.add_parser('parse-1099b', parents=[common],
+                                      help='Summarize stock sales from 1099-B PDFs')
+    parse_1099b.add_argument('directory', nargs='?', help='Directory of 1099-B PDFs')
+    parse_1099b.set_defaults(func=run_parse_1099b)
+
+    verify = commands.add_parser('verify-cagr', parents=[common],
+                                 help='Recompute CAGR for symbols from the raw exports')
+    verify.add_argument('symbols', nargs='*', help='Symbols to verify (default: NVDA)')
+    verify.set_defaults(func=run_verify_cagr)
+
+    serve = commands.add_parser('serve', parents=[common],
+                                help='Keep the lots and price histories loaded and answer queries over HTTP')
+    serve.add_argument('paths', nargs='*', help='Brokerage exports (default: gains.PATHS)')
+    serve.add_argument('--port', type=int, default=8765, help='Localhost port to listen on')
+    serve.set_defaults(func=run_serve)
+
+    query = commands.add_parser('query', help='Ask a running portfolio server')
+    query.add_argument('query', choices=['status', 'holdings', 'cagr', 'worm', 'counterfactual'])
+    query.add_argument('params', nargs='*', metavar='NAME=VALUE',
+                       help='Query parameters, e.g. date=06/13/2025 symbols=NVDA,AAPL index=^GSPC')
+    query.add_argument('--port', type=int, default=8765, help='Port the server listens on')
+    query.add_argument('--timeout', type=float, default=120, help='Seconds to wait for an answer')
+    query.add_argument('--json', action='store_true', help='Print the raw JSON answer')
+    query.set_defaults(func=run_query, profile=False, trace=None)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not (args.profile or args.trace):
+        return args.func(args)
+
+    import instrument
+    instrument.enable()
+    try:
+        with instrument.span(args.command):
+            return args.func(args)
+    finally:
+        instrument.disable()
+        print(instrument.summary())
+        if args.trace:
+            instrument.write_trace(args.trace)
+            print(f'Trace written to {args.trace}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
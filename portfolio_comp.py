@@ -1,10 +1,13 @@
 import os
 import csv
 import argparse
-import yfinance as yf
 import warnings
 from tabulate import tabulate
 from datetime import datetime, timedelta
+import numpy as np
+from portfolio import Portfolio
+from cache_stocks import refresh_symbols
+import ticker_store
 
 # Suppress FutureWarnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
@@ -30,61 +33,60 @@ def read_csv_files(directory):
 
     return valid_transactions
 
-def fetch_stock_price(symbol, start_date):
-    try:
-        start_date = datetime.strptime(start_date, "%m/%d/%y").strftime("%Y-%m-%d")
-        stock = yf.Ticker(symbol)
-        end_date = (datetime.strptime(start_date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
-        history = stock.history(period="1d", start=start_date, end=end_date)
-        stock_price = history['Close'][0]
-        return stock_price
-    except Exception as e:
-        print(f"Error fetching stock price for {symbol}: {str(e)}")
-        return None
+def load_prices(port, symbols, txn_dates):
+    """Refresh the shared ticker cache for symbols, covering every transaction date."""
+    first_date = min(txn_dates)
+    start_date = (first_date - timedelta(days=30)).strftime('%Y-%m-%d')
+    first_day = ticker_store.iso_to_day(first_date.strftime('%Y-%m-%d'))
+    refresh_symbols(port, symbols, start_date, {sym: first_day for sym in symbols})
 
-def fetch_current_stock_price(symbol):
-    try:
-        stock = yf.Ticker(symbol)
-        history = stock.history(period="1d")
-        stock_price = history['Close'][0]
-        return stock_price
-    except Exception as e:
-        print(f"Error fetching stock price for {symbol}: {str(e)}")
+def latest_cached_price(port, symbol):
+    series = port.ticker_cache.get(symbol)
+    if series is None or len(series) == 0:
         return None
+    return float(series.closes[-1])
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description='Filter transactions of type "Bought" with non-zero quantity and exclude those with the description "STK SPLIT ON" from CSV files in a directory. Compute profit/loss, number of transactions, total cost, and profit percentage for the remaining transactions.')
     parser.add_argument('-f', '--directory', required=True, help='Path to the directory containing CSV files')
-    args = parser.parse_args()
+    parser.add_argument('-b', '--benchmark', default='QQQ', help='Comma-separated benchmark symbols to compare against (default: QQQ)')
+    args = parser.parse_args(argv)
 
     directory = args.directory
+    benchmarks = [b.strip().upper() for b in args.benchmark.split(',') if b.strip()]
     valid_transactions = read_csv_files(directory)
+    if not valid_transactions:
+        print(f"No bought transactions found in {directory}")
+        return
+
+    # All prices come from the shared ticker cache, refreshed once up front
+    port = Portfolio()
+    txn_dates = [datetime.strptime(t['TransactionDate'], "%m/%d/%y") for t in valid_transactions]
+    load_prices(port, set(t['Symbol'] for t in valid_transactions) | set(benchmarks), txn_dates)
 
     # Create dictionaries to store data for each symbol
     symbol_data = {}
-    total_qqq_qty = 0
-    total_qqq_cost = 0
     recent_prices = {}
+    priced = np.zeros(len(valid_transactions), dtype=bool)
+    costs = np.zeros(len(valid_transactions))
 
-    for transaction in valid_transactions:
+    for i, transaction in enumerate(valid_transactions):
         symbol = transaction['Symbol']
         quantity = int(transaction['Quantity'])
         price = float(transaction['Price'])
-        amount = float(transaction['Amount'])
-        txn_date = transaction['TransactionDate']
 
-        # Fetch the most recent stock price
+        # Most recent cached price
         if symbol not in recent_prices:
-          recent_prices[symbol] = fetch_current_stock_price(symbol)
-          print(f"Most recent price {symbol} {recent_prices[symbol]:.2f}")
+          recent_prices[symbol] = latest_cached_price(port, symbol)
+          if recent_prices[symbol] is not None:
+            print(f"Most recent price {symbol} {recent_prices[symbol]:.2f}")
 
         stock_price = recent_prices[symbol]
         if stock_price is not None:
             # Calculate the profit/loss
             profit_loss = (stock_price - price) * quantity
-            qqq_price = fetch_stock_price("QQQ", txn_date)
-            total_qqq_qty += float(price * quantity /qqq_price)
-            total_qqq_cost += float(price * quantity)
+            priced[i] = True
+            costs[i] = price * quantity
 
             if symbol in symbol_data:
                 symbol_data[symbol]['num_transactions'] += 1
@@ -116,12 +118,24 @@ def main():
     total_cost = sum(data['total_cost'] for data in symbol_data.values())
     total_profit = sum(data['profit'] for data in symbol_data.values())
     total_profit_percentage = (total_profit / total_cost) * 100
-    total_qqq_amount = total_qqq_qty * fetch_current_stock_price("QQQ")
 
     print(f"Total cost: {total_cost:.2f}, total profit: {total_profit:.2f}, % profit: {total_profit_percentage:.2f}")
-    total_qqq_profit = total_qqq_amount - total_qqq_cost
-    qqq_perc_profit = total_qqq_profit/total_qqq_cost * 100.0
-    print(f"QQQ cost:{total_qqq_cost:.2f} qqq profit: {total_qqq_profit:.2f} % profit: {qqq_perc_profit:.2f}")
+
+    # What if every purchase had bought the benchmark instead: one as-of
+    # lookup per benchmark resolves all transaction dates at once
+    txn_days = ticker_store.to_days([d for d, ok in zip(txn_dates, priced) if ok])
+    for benchmark in benchmarks:
+        try:
+            benchmark_prices = port.prices_asof(benchmark, txn_days)
+        except (KeyError, ValueError) as e:
+            print(f"Can't price benchmark {benchmark}: {e}")
+            continue
+        total_benchmark_qty = float(np.sum(costs[priced] / benchmark_prices))
+        total_benchmark_cost = float(np.sum(costs[priced]))
+        total_benchmark_amount = total_benchmark_qty * latest_cached_price(port, benchmark)
+        total_benchmark_profit = total_benchmark_amount - total_benchmark_cost
+        benchmark_perc_profit = total_benchmark_profit/total_benchmark_cost * 100.0
+        print(f"{benchmark} cost:{total_benchmark_cost:.2f} {benchmark.lower()} profit: {total_benchmark_profit:.2f} % profit: {benchmark_perc_profit:.2f}")
 
 if __name__ == "__main__":
     main()
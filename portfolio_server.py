@@ -0,0 +1,255 @@
+"""
+Long-running portfolio server.
+
+PortfolioState keeps one Portfolio resident: the parsed, split-adjusted lots
+of the exports and the memory-mapped ticker histories stay loaded between
+queries, along with pandas, so a query costs only its own computation.
+Before each query the exports and the loaded histories are checked by mtime
+and size, a history's as they were when it was mapped: a changed export is re-parsed (through ingest's caches), a changed
+history is re-mapped on its next use, and either rebuilds the lot table.
+Quantities are split-adjusted up to today, whatever date a query asks for.
+
+Queries are GET requests to a localhost-only HTTP server and are answered as
+JSON; errors come back as {"error": ...} with status 400:
+
+    /status
+    /holdings[?date=MM/DD/YYYY]
+    /cagr[?symbols=NVDA,AAPL&date=MM/DD/YYYY]
+    /worm[?start=MM/DD/YYYY&end=MM/DD/YYYY&frequency=weekly&index=^GSPC,^IXIC]
+    /counterfactual[?benchmarks=QQQ,SPY&start=MM/DD/YYYY&end=MM/DD/YYYY&frequency=weekly]
+
+Requests are served one at a time. portfolio_cli.py serve starts the server
+and portfolio_cli.py query is its client:
+
+    python portfolio_cli.py query holdings date=06/13/2025
+"""
+import json
+import math
+import os
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from disk_cache import file_stat
+from gains import add_exports, most_recent_working_day
+from holdings import summarize_holdings
+from ingest import parse_exports
+from portfolio import Portfolio, convert_date_format
+from returns import annualized_twr, lots_twr, money_weighted_returns
+import price_provider
+import ticker_store
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+
+def stat_or_none(path):
+    try:
+        return file_stat(path)
+    except OSError:
+        return None
+
+
+def to_json(value):
+    """value with numpy scalars and arrays as plain numbers and lists, and NaN as None."""
+    if isinstance(value, dict):
+        return {str(k): to_json(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [to_json(v) for v in value]
+    if isinstance(value, (np.integer,)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return None if math.isnan(value) else float(value)
+    return value
+
+
+def split_list(text):
+    return [item.strip() for item in text.split(',') if item.strip()] if text else []
+
+
+class ResidentPortfolio(Portfolio):
+    """A Portfolio that notes the file stat of each history as it maps it, for PortfolioState.refresh()."""
+
+    def __init__(self, ticker_dir=None, ticker_stats=None):
+        super().__init__(ticker_dir=ticker_dir)
+        self.ticker_stats = {} if ticker_stats is None else ticker_stats
+
+    def cache_ticker_data(self, symbol):
+        # Stat before mapping: a file replaced in between then looks changed
+        # and is re-mapped, instead of the new file passing for the old one
+        stat = stat_or_none(ticker_store.store_path(symbol, self.ticker_dir))
+        super().cache_ticker_data(symbol)
+        if symbol in self.ticker_cache:
+            self.ticker_stats[symbol] = stat
+
+
+class PortfolioState:
+    def __init__(self, paths, ticker_dir=None):
+        self.paths = list(paths)
+        self.ticker_dir = ticker_dir or price_provider.default_provider().store_dir
+        self.port = None
+        self.cash = []
+        self.export_stats = {}
+        self.ticker_stats = {}
+        self.loaded_at = None
+        self.reloads = 0
+        self.queries = 0
+
+    def ticker_stat(self, symbol):
+        return stat_or_none(ticker_store.store_path(symbol, self.ticker_dir))
+
+    def refresh(self):
+        """Reload whatever changed on disk since the last query. Returns True if the lots were rebuilt."""
+        export_stats = {path: stat_or_none(path) for path in self.paths}
+        stale = self.port is None or export_stats != self.export_stats
+
+        if self.port is not None:
+            for symbol in list(self.port.ticker_cache):
+                # Histories not mapped from the store (live lookups) have no stat
+                if symbol not in self.ticker_stats or self.ticker_stat(symbol) != self.ticker_stats[symbol]:
+                    # Re-mapped on next use
+                    del self.port.ticker_cache[symbol]
+                    self.ticker_stats.pop(symbol, None)
+                    stale = True
+
+        if stale:
+            self.load(export_stats)
+        return stale
+
+    def load(self, export_stats):
+        """Parse the exports into a fresh Portfolio, keeping already-mapped histories that did not change."""
+        port = ResidentPortfolio(self.ticker_dir, self.ticker_stats)
+        if self.port is not None:
+            port.ticker_cache = self.port.ticker_cache
+        paths = [path for path in self.paths if export_stats[path] is not None]
+        for path in self.paths:
+            if export_stats[path] is None:
+                print(f'Missing export: {path}')
+        exports = parse_exports(paths, ticker_dir=self.ticker_dir)
+        today = ticker_store.iso_to_day(convert_date_format(most_recent_working_day()))
+        self.cash = add_exports(port, paths, exports, today)
+        self.port = port
+        self.export_stats = export_stats
+        self.loaded_at = datetime.now().isoformat(timespec='seconds')
+        self.reloads += 1
+        print(f'Loaded {len(port.lots)} lots of {len(port.lots.held_symbols())} symbols from {len(paths)} exports')
+
+    # -----------------------------
+    # Queries
+    # -----------------------------
+    def status(self):
+        return {
+            'exports': {path: stat is not None for path, stat in self.export_stats.items()},
+            'lots': len(self.port.lots),
+            'symbols': self.port.lots.held_symbols(),
+            'histories_loaded': len(self.port.ticker_cache),
+            'loaded_at': self.loaded_at,
+            'reloads': self.reloads,
+            'queries': self.queries,
+        }
+
+    def summary(self, date):
+        date = date or most_recent_working_day()
+        summary = summarize_holdings(self.port, self.port.lots, date)
+        value_day = ticker_store.iso_to_day(convert_date_format(date))
+        xirr, symbol_xirr = money_weighted_returns(self.port.lots, summary.lot_value, value_day)
+        return date, summary, xirr, symbol_xirr
+
+    def holdings(self, date=None):
+        date, summary, xirr, symbol_xirr = self.summary(date)
+        cagr = summary.symbol_cagr()
+        rows = [{'symbol': symbol, 'qty': summary.qty[i], 'value': summary.value[i], 'gain': summary.gain[i],
+                 'cagr': cagr[i], 'xirr': symbol_xirr[symbol]}
+                for i, symbol in enumerate(summary.symbols)]
+        rows.sort(key=lambda row: -row['value'])
+        return {
+            'date': date,
+            'rows': rows,
+            'total_value': summary.total_value(),
+            'total_gain': summary.total_gain(),
+            'weighted_average_cagr': summary.weighted_average_cagr,
+            'xirr': xirr,
+            'twr': annualized_twr(self.port, self.port.lots, ticker_store.iso_to_day(convert_date_format(date)))[1],
+            'cash': dict(self.cash),
+        }
+
+    def cagr(self, symbols=None, date=None):
+        date, summary, _, symbol_xirr = self.summary(date)
+        wanted = set(split_list(symbols)) or set(summary.symbols)
+        cagr = summary.symbol_cagr()
+        lot_counts = np.bincount(self.port.lots.symbol_code, minlength=len(self.port.lots.symbols))
+        rows = [{'symbol': symbol, 'lots': lot_counts[self.port.lots.code(symbol)], 'cagr': cagr[i],
+                 'xirr': symbol_xirr[symbol]}
+                for i, symbol in enumerate(summary.symbols) if symbol in wanted]
+        return {'date': date, 'rows': rows}
+
+    def worm(self, start=None, end=None, frequency='daily', index=None):
+        end = end or datetime.today().strftime('%m/%d/%Y')
+        dates = self.port.worm_dates(start, end, frequency)
+        query_days = ticker_store.to_days(dates)
+        values, aapl_values = self.port.worm_series(None, query_days)
+        result = {'dates': [d.strftime('%Y-%m-%d') for d in dates], 'values': values, 'aapl': aapl_values,
+                  'twr': lots_twr(self.port, self.port.lots, query_days)}
+        indexes = split_list(index)
+        if indexes:
+            frame = self.port.counterfactual(indexes, start, end, frequency=frequency)
+            result['index'] = {name: frame[name].to_numpy() for name in indexes}
+        return result
+
+    def counterfactual(self, benchmarks=None, start=None, end=None, frequency='daily'):
+        frame = self.port.counterfactual(split_list(benchmarks) or None, start, end, frequency=frequency)
+        ranked = self.port.rank_counterfactuals(frame)
+        rows = [{'benchmark': name, 'final_value': row['Final value'], 'gain': row['Gain'],
+                 'gain_percent': row['Gain %']} for name, row in ranked.iterrows()]
+        return {'start': start, 'end': end, 'rows': rows}
+
+    QUERIES = ('status', 'holdings', 'cagr', 'worm', 'counterfactual')
+
+    def answer(self, name, params):
+        """Result of query name with params ({name: value}), as JSON-ready data."""
+        if name not in self.QUERIES:
+            raise ValueError(f"Unknown query {name!r}; expected one of {', '.join(self.QUERIES)}")
+        started = time.perf_counter()
+        reloaded = self.refresh()
+        self.queries += 1
+        result = getattr(self, name)(**params)
+        result['elapsed_ms'] = (time.perf_counter() - started) * 1000
+        result['reloaded'] = reloaded
+        return to_json(result)
+
+
+def make_handler(state):
+    class QueryHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            try:
+                body, status = state.answer(url.path.strip('/') or 'status', params), 200
+            except Exception as e:
+                body, status = {'error': f'{type(e).__name__}: {e}'}, 400
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return QueryHandler
+
+
+def serve(paths, host=DEFAULT_HOST, port=DEFAULT_PORT, ticker_dir=None):
+    state = PortfolioState(paths, ticker_dir)
+    state.refresh()
+    server = HTTPServer((host, port), make_handler(state))
+    print(f'Serving portfolio queries on http://{host}:{port}/ (pid {os.getpid()})')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
@@ -0,0 +1,85 @@
+"""
+Vectorized price-matrix engine.
+
+Turns the per-symbol ticker cache into a date x symbol matrix of close prices
+and evaluates worm curves as a handful of array operations instead of a
+per-day, per-lot loop of cached price lookups.
+"""
+import numpy as np
+
+from ticker_store import day_to_iso
+
+
+def missing_price_error(symbol, date):
+    if not isinstance(date, str):
+        date = day_to_iso(date)
+    return ValueError(f"Could not find cached price for {symbol} on or after {date} (checked 10 days ahead). Cache may need refresh.")
+
+
+def require_prices(prices, needed, symbols, days):
+    """
+    Raise the cached-lookup error for the first (day, lot) cell that is needed
+    but has no price. symbols/days label the columns and rows of `prices`.
+    """
+    missing = needed & np.isnan(prices)
+    if missing.any():
+        row, col = np.argwhere(missing)[0]
+        raise missing_price_error(symbols[col], days[row])
+
+
+def require_series(symbol, prices, needed, days):
+    """1-D variant of require_prices for a single symbol's prices on `days`."""
+    missing = needed & np.isnan(prices)
+    if missing.any():
+        raise missing_price_error(symbol, days[np.argmax(missing)])
+
+
+def held_amounts(query_days, lot_days, amounts, columns, n_columns):
+    """
+    (days x columns) total amount of the lots acquired on or before each
+    query day, by column (e.g. shares per symbol). Each column's lots are
+    summed cumulatively in acquisition order and looked up with one
+    searchsorted, so the cost is O(lots + days x columns) instead of days x
+    lots, and a day's total does not depend on the other days asked for.
+    """
+    lot_days, amounts, columns = np.asarray(lot_days), np.asarray(amounts), np.asarray(columns)
+    order = np.lexsort((lot_days, columns))
+    lot_days, amounts, columns = lot_days[order], amounts[order], columns[order]
+    bounds = np.searchsorted(columns, np.arange(n_columns + 1))
+    held = np.zeros((len(query_days), n_columns))
+    for col in np.flatnonzero(np.diff(bounds)):
+        lo, hi = bounds[col], bounds[col + 1]
+        totals = np.concatenate([[0.0], np.cumsum(amounts[lo:hi])])
+        held[:, col] = totals[np.searchsorted(lot_days[lo:hi], query_days, side='right')]
+    return held
+
+
+def counterfactual_values(query_days, lot_days, lot_cost, buy_prices, cur_prices):
+    """
+    (days x benchmarks) value had each lot's cost bought every benchmark on
+    its acquisition day. buy_prices is (lots x benchmarks) at the lot days and
+    cur_prices (days x benchmarks) at query_days. Shares are accumulated over
+    the lots in acquisition order, so the cost is O((lots + days) x
+    benchmarks) instead of days x lots x benchmarks. A missing buy price
+    leaves its benchmark NaN from that lot on.
+    """
+    lot_days = np.asarray(lot_days)
+    order = np.argsort(lot_days, kind='stable')
+    shares = lot_cost[order, None] / buy_prices[order]
+    held = np.vstack([np.zeros((1, shares.shape[1])), np.cumsum(shares, axis=0)])
+    count = np.searchsorted(lot_days[order], query_days, side='right')
+    return np.where((count > 0)[:, None], held[count] * cur_prices, 0.0)
+
+
+def rank_final_values(values, benchmarks, invested):
+    """
+    Benchmarks ordered by their last value, best first, as (benchmark, final
+    value, gain, gain %) rows. Benchmarks without a final value come last.
+    """
+    final = values[-1] if len(values) else np.full(len(benchmarks), np.nan)
+    order = sorted(range(len(benchmarks)), key=lambda i: (np.isnan(final[i]), -final[i]))
+    rows = []
+    for i in order:
+        gain = final[i] - invested
+        rows.append((benchmarks[i], final[i], gain, gain / invested * 100 if invested else np.nan))
+    return rows
@@ -0,0 +1,150 @@
+"""
+Pluggable sources of daily close prices.
+
+Every module fetches prices through a PriceProvider instead of calling
+yfinance directly, so the whole pipeline can run against the local ticker
+store or a deterministic synthetic market on a machine with no network.
+
+    YFinanceProvider   Yahoo Finance (the default)
+    StoreProvider      the ticker_data/ binary store
+    SyntheticProvider  seeded random walks, identical on every run
+
+get_range(symbols, start, end) is the primary call: cache refreshes go
+through it (Portfolio.download_histories), single-date live lookups use
+history(). Set PORTFOLIO_PRICES to
+'yfinance', 'store' or 'synthetic' to choose default_provider().
+
+Each provider names the ticker store its closes are cached in (store_dir),
+which a Portfolio uses unless given another: synthetic closes go to their
+own directory and never into the real ticker_data/.
+"""
+import os
+import zlib
+
+import numpy as np
+
+import downloader
+import ticker_store
+
+
+# Where the synthetic market's closes are cached, apart from the real ones
+SYNTHETIC_TICKER_DIR = 'ticker_data_synthetic'
+
+
+class PriceProvider:
+    """Base class. Subclasses implement history(); dates are 'YYYY-MM-DD' and end is exclusive."""
+
+    # Ticker store the closes are cached in; synthetic ones must not mix with real ones
+    store_dir = ticker_store.TICKER_DIR
+    synthetic = False
+
+    def history(self, symbol, start, end):
+        """Daily closes for one symbol as {'YYYY-MM-DD': close}."""
+        raise NotImplementedError
+
+    def get_range(self, symbols, start, end):
+        """
+        Daily closes for many symbols as {symbol: {'YYYY-MM-DD': close}}.
+        Symbols that could not be fetched are reported and left out.
+        """
+        histories, errors = downloader.download_histories({sym: (start, end) for sym in symbols}, self)
+        for sym, e in sorted(errors.items()):
+            print(f'Error fetching {sym}: {e}')
+        return histories
+
+
+class YFinanceProvider(PriceProvider):
+    """Downloads closes from Yahoo Finance, concurrently for get_range()."""
+
+    def history(self, symbol, start, end):
+        import yfinance as yf
+
+        hist = yf.Ticker(symbol).history(start=start, end=end)
+        return {str(ts).split()[0]: float(close) for ts, close in zip(hist.index, hist['Close'])}
+
+
+class StoreProvider(PriceProvider):
+    """Serves closes from a ticker store directory without touching the network."""
+
+    def __init__(self, directory=ticker_store.TICKER_DIR):
+        self.directory = directory
+        self.store_dir = directory
+
+    def history(self, symbol, start, end):
+        series = ticker_store.load(symbol, self.directory)
+        if series is None:
+            raise ValueError(f'{symbol} is not in {self.directory}')
+        return series_range(series, start, end)
+
+    def get_range(self, symbols, start, end):
+        histories = {}
+        for sym in symbols:
+            series = ticker_store.load(sym, self.directory)
+            if series is None:
+                print(f'Error fetching {sym}: not in {self.directory}')
+                continue
+            histories[sym] = series_range(series, start, end)
+        return histories
+
+
+class SyntheticProvider(PriceProvider):
+    """
+    Deterministic geometric random walks on business days. Each symbol's path
+    depends only on the seed and the symbol, so any range of any run agrees.
+    """
+
+    store_dir = SYNTHETIC_TICKER_DIR
+    synthetic = True
+
+    ORIGIN = '1990-01-01'
+    UNTIL = '2040-12-31'
+    TRADING_DAYS = 252
+
+    def __init__(self, seed=0, drift=0.08, volatility=0.25):
+        self.seed = seed
+        self.drift = drift
+        self.volatility = volatility
+        self._series = {}
+
+    def series(self, symbol):
+        if symbol not in self._series:
+            days = np.arange(np.datetime64(self.ORIGIN), np.datetime64(self.UNTIL))
+            days = days[np.is_busday(days)]
+            key = zlib.crc32(symbol.encode())
+            rng = np.random.default_rng([self.seed, key])
+            daily_vol = self.volatility / np.sqrt(self.TRADING_DAYS)
+            daily_drift = self.drift / self.TRADING_DAYS - daily_vol ** 2 / 2
+            log_returns = rng.normal(daily_drift, daily_vol, len(days))
+            start_price = 10.0 + key % 490
+            closes = start_price * np.exp(np.cumsum(log_returns))
+            self._series[symbol] = ticker_store.PriceSeries(days.astype(np.int64), closes)
+        return self._series[symbol]
+
+    def history(self, symbol, start, end):
+        return series_range(self.series(symbol), start, end)
+
+    def get_range(self, symbols, start, end):
+        return {sym: self.history(sym, start, end) for sym in symbols}
+
+
+def series_range(series, start, end):
+    """Slice a PriceSeries to [start, end) as {'YYYY-MM-DD': close}."""
+    days = series.days
+    lo, hi = np.searchsorted(days, [ticker_store.iso_to_day(start), ticker_store.iso_to_day(end)])
+    dates = days[lo:hi].astype('datetime64[D]').astype(str)
+    return dict(zip(dates.tolist(), series.closes[lo:hi].tolist()))
+
+
+PROVIDERS = {
+    'yfinance': YFinanceProvider,
+    'store': StoreProvider,
+    'synthetic': SyntheticProvider,
+}
+
+
+def default_provider():
+    """The provider named by $PORTFOLIO_PRICES, Yahoo Finance if unset."""
+    name = os.environ.get('PORTFOLIO_PRICES', 'yfinance')
+    if name not in PROVIDERS:
+        raise ValueError(f'Unknown PORTFOLIO_PRICES={name!r}; expected one of {", ".join(PROVIDERS)}')
+    return PROVIDERS[name]()
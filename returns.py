@@ -0,0 +1,162 @@
+"""
+Money-weighted and time-weighted portfolio returns.
+
+The lots of a LotTable are treated as dated cash flows: each lot's cost paid
+on its acquisition day, and its market value received on the valuation day.
+
+xirr() solves for the annual rate that zeroes every group's flows at once
+(Newton steps on log(1 + rate), falling back to bisection inside a bracket),
+so the portfolio and all symbols cost one array pass per iteration.
+time_weighted_returns() chains daily returns of the shares held at the start
+of each day, so purchases move the value but not the return.
+"""
+from datetime import datetime
+
+import numpy as np
+
+import price_matrix
+import ticker_store
+
+
+DAYS_PER_YEAR = 365.25
+
+# Search range for log(1 + rate): about -100% to +48,500,000% a year
+LOG_RATE_BOUNDS = (-20.0, 20.0)
+
+
+def xirr(days, amounts, groups, n_groups, tol=1e-12, max_iter=100):
+    """
+    Annual internal rate of return of each group of dated cash flows (days
+    since the epoch, negative amounts paid out, positive received). Returns
+    n_groups rates; a group whose flows do not change sign over the search
+    range gets NaN.
+    """
+    days = np.asarray(days, dtype=np.int64)
+    amounts = np.asarray(amounts, dtype=np.float64)
+    groups = np.asarray(groups, dtype=np.int64)
+    if len(days) == 0:
+        return np.full(n_groups, np.nan)
+
+    # Years from each flow to the last flow of its group, so exponents stay >= 0
+    last_day = np.full(n_groups, np.iinfo(np.int64).min)
+    np.maximum.at(last_day, groups, days)
+    years = (last_day[groups] - days) / DAYS_PER_YEAR
+    max_years = np.zeros(n_groups)
+    np.maximum.at(max_years, groups, years)
+
+    def value(x):
+        """Flows compounded to each group's last day at log rate x, and the derivative."""
+        growth = np.exp(x[groups] * years)
+        return (np.bincount(groups, amounts * growth, n_groups),
+                np.bincount(groups, amounts * years * growth, n_groups))
+
+    # Keep exp() finite for the longest-held flow of each group
+    with np.errstate(divide='ignore'):
+        limit = np.where(max_years > 0, 700.0 / max_years, np.inf)
+    lo = np.maximum(LOG_RATE_BOUNDS[0], -limit)
+    hi = np.minimum(LOG_RATE_BOUNDS[1], limit)
+    f_lo, _ = value(lo)
+    f_hi, _ = value(hi)
+    active = np.sign(f_lo) * np.sign(f_hi) < 0
+
+    x = np.clip(np.log1p(0.1), lo, hi)
+    last_move = hi - lo
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        f, df = value(x)
+        below = np.sign(f) == np.sign(f_lo)
+        lo = np.where(active & below, x, lo)
+        hi = np.where(active & ~below, x, hi)
+        # Newton unless it leaves the bracket or stops at least halving its step
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            step = x - f / df
+            newton = np.isfinite(step) & (step >= lo) & (step <= hi) & (np.abs(2 * f) <= np.abs(last_move * df))
+        step = np.where(newton, step, (lo + hi) / 2)
+        step = np.where(f == 0, x, step)
+        last_move = step - x
+        converged = (np.abs(step - x) <= tol * np.maximum(1.0, np.abs(x))) | (f == 0)
+        x = np.where(active, step, x)
+        active &= ~converged
+
+    has_root = np.sign(f_lo) * np.sign(f_hi) < 0
+    return np.where(has_root, np.expm1(x), np.nan)
+
+
+def money_weighted_returns(lots, lot_value, value_day):
+    """
+    (portfolio XIRR, {symbol: XIRR}) of lots (a LotTable) bought at their cost
+    basis on their acquisition days and worth lot_value on value_day (days
+    since the epoch). Lots without a cost or value are left out.
+    """
+    n_symbols = len(lots.symbols)
+    cost = lots.price_paid * lots.qty
+    valued = np.isfinite(cost) & np.isfinite(lot_value)
+    lot_days = lots.day[valued]
+    codes = lots.symbol_code[valued].astype(np.int64)
+    value_days = np.full(len(lot_days), value_day, dtype=np.int64)
+    flows = np.concatenate([-cost[valued], lot_value[valued]])
+
+    # Every symbol is a group, and the whole portfolio one more
+    rates = xirr(
+        days=np.concatenate([lot_days, value_days, lot_days, value_days]),
+        amounts=np.concatenate([flows, flows]),
+        groups=np.concatenate([codes, codes, np.full(2 * len(codes), n_symbols)]),
+        n_groups=n_symbols + 1,
+    )
+    return float(rates[n_symbols]), {symbol: float(rates[lots.code(symbol)]) for symbol in lots.held_symbols()}
+
+
+def time_weighted_returns(query_days, lot_days, lot_qty, lot_codes, prices):
+    """
+    Cumulative time-weighted return on each query day since the first.
+    prices is (days x symbols) with columns indexed by lot_codes. Each period
+    is priced with the shares held at its start; symbols without a price at
+    either end of a period sit it out.
+    """
+    held = price_matrix.held_amounts(query_days, lot_days, lot_qty, lot_codes, prices.shape[1])[:-1]
+    priced = np.isfinite(prices[:-1]) & np.isfinite(prices[1:])
+    start = np.where(priced, held * prices[:-1], 0.0).sum(axis=1)
+    end = np.where(priced, held * prices[1:], 0.0).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        period = np.where(start > 0, end / start - 1, 0.0)
+    return np.concatenate([[0.0], np.cumprod(1 + period) - 1])[:len(query_days)]
+
+
+def business_days(start_day, end_day):
+    """Weekdays from start_day to end_day inclusive, as days since the epoch."""
+    days = np.arange(start_day, end_day + 1, dtype=np.int64)
+    return days[np.is_busday(days.astype('datetime64[D]'))]
+
+
+def lots_twr(port, lots, query_days):
+    """
+    Cumulative time-weighted return of lots (a LotTable) on query_days
+    (ascending days since the epoch), priced from port's ticker cache.
+    """
+    prices = np.column_stack([port.cached_prices(symbol, query_days) for symbol in lots.symbols] or
+                             [np.empty((len(query_days), 0))])
+    return time_weighted_returns(query_days, lots.day, lots.qty, lots.symbol_code.astype(np.int64), prices)
+
+
+def annualized_twr(port, lots, end_day):
+    """
+    (cumulative, annualized) time-weighted return of lots from the first
+    acquisition to end_day over business days, or (nan, nan) without lots.
+    """
+    if not len(lots) or end_day <= lots.day.min():
+        return np.nan, np.nan
+    start_day = int(lots.day.min())
+    twr = float(lots_twr(port, lots, business_days(start_day, end_day))[-1])
+    return twr, (1 + twr) ** (DAYS_PER_YEAR / (end_day - start_day)) - 1
+
+
+def portfolio_twr(port, lots, start_date, end_date=None, frequency='daily'):
+    """
+    Time-weighted return of lots (a LotTable) from start_date to end_date
+    ('MM/DD/YYYY', default today) as a pandas Series, priced from port's
+    ticker cache on Portfolio.worm_dates().
+    """
+    import pandas as pd
+    dates = port.worm_dates(start_date, end_date or datetime.today().strftime('%m/%d/%Y'), frequency)
+    return pd.Series(lots_twr(port, lots, ticker_store.to_days(dates)), index=dates, name='TWR')
@@ -0,0 +1,140 @@
+"""
+Corporate-actions index of stock splits.
+
+SplitIndex keeps each symbol's split days as a sorted int32 array next to the
+cumulative split factor up to each of them, so the factor between any two
+days is two searchsorted lookups and a division. adjust() scales the
+quantities of a whole LotTable at once, each lot by the splits between its
+export's as-of day and the valuation day.
+
+Splits come from KNOWN_SPLITS and STOCK_SPLITS in config.py (gitignored)
+only. A split shows up in the price data when Yahoo rescales a history:
+the cache refresh finds the cached closes no longer match and downloads the
+history again, and the old closes over the new ones step down by the split
+ratio on the split day. detect_rescaling() finds those steps, and the
+refresh reports the ones not listed here for confirming in config.py. They
+are never applied to quantities.
+"""
+import numpy as np
+
+import ticker_store
+
+
+# {symbol: [('YYYY-MM-DD', ratio), ...]}; ratio is the quantity multiplier
+KNOWN_SPLITS = {
+    'VGT': [('2026-04-21', 8.0)],  # 8:1 split on 04/21/2026
+}
+
+# Whole-number ratios a step is matched against, both ways (forward and
+# reverse splits). 3:2 style ratios are left out: within a day's tolerance
+# they are too easily mistaken for ordinary moves.
+SPLIT_RATIOS = (2, 3, 4, 5, 6, 7, 8, 10, 12, 15, 20, 25, 30, 40, 50)
+
+# How far (relative) a jump may be from a ratio, for the day's own move
+SPLIT_TOLERANCE = 0.05
+
+
+def configured_splits():
+    """KNOWN_SPLITS with STOCK_SPLITS from config.py added."""
+    try:
+        from config import STOCK_SPLITS
+    except ImportError:
+        STOCK_SPLITS = {}
+    splits = {symbol: list(entries) for symbol, entries in KNOWN_SPLITS.items()}
+    for symbol, entries in STOCK_SPLITS.items():
+        splits.setdefault(symbol, []).extend(entries)
+    return splits
+
+
+def detect_splits(days, closes, ratios=SPLIT_RATIOS, tolerance=SPLIT_TOLERANCE):
+    """
+    [(day, ratio)] of close-to-close jumps in a price history that match a
+    split ratio: the first close after the split is the previous one divided
+    by the ratio. Reverse splits give ratios below 1.
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    if len(closes) < 2:
+        return []
+    with np.errstate(divide='ignore', invalid='ignore'):
+        jump = np.log(closes[:-1] / closes[1:])
+    candidates = np.log(np.asarray(ratios, dtype=np.float64))
+    candidates = np.concatenate([candidates, -candidates])
+    nearest = np.argmin(np.abs(jump[:, None] - candidates[None, :]), axis=1)
+    found = np.abs(jump - candidates[nearest]) < np.log1p(tolerance)
+    return [(int(days[i + 1]), float(np.exp(candidates[nearest[i]]))) for i in np.flatnonzero(found)]
+
+
+def detect_rescaling(old_days, old_closes, new_days, new_closes):
+    """
+    [(day, ratio)] splits implied by a re-downloaded history: the old closes
+    over the new ones, on the days both have, step down by the ratio on each
+    split day. Dividend adjustments move the scale too little to match.
+    """
+    days, old_at, new_at = np.intersect1d(old_days, new_days, return_indices=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = np.asarray(old_closes, dtype=np.float64)[old_at] / np.asarray(new_closes, dtype=np.float64)[new_at]
+    return detect_splits(days, scale)
+
+
+class SplitIndex:
+    def __init__(self, splits=None):
+        """splits: {symbol: [(day or 'YYYY-MM-DD', ratio), ...]}, default configured_splits()."""
+        self.days = {}
+        self.factors = {}
+        for symbol, entries in (configured_splits() if splits is None else splits).items():
+            self.add(symbol, entries)
+
+    def unlisted(self, symbol, found, window=5):
+        """
+        The (day, ratio) splits of found that are not listed for symbol. One
+        within window days of a listed split is taken to be that split.
+        """
+        listed = self.days.get(symbol, np.empty(0, dtype=np.int32)).astype(np.int64)
+        return [(day, ratio) for day, ratio in found if not np.any(np.abs(listed - day) <= window)]
+
+    def add(self, symbol, entries):
+        """Add (day or 'YYYY-MM-DD', ratio) splits for symbol."""
+        entries = [(ticker_store.iso_to_day(day) if isinstance(day, str) else int(day), float(ratio))
+                   for day, ratio in entries]
+        if symbol in self.days:
+            entries += list(self.splits(symbol))
+        entries.sort()
+        self.days[symbol] = np.array([day for day, _ in entries], dtype=np.int32)
+        self.factors[symbol] = np.cumprod([1.0] + [ratio for _, ratio in entries])
+
+    def splits(self, symbol, after=None, until=None):
+        """(day, ratio) splits of symbol with after < day <= until (either bound optional)."""
+        days = self.days.get(symbol, np.empty(0, dtype=np.int32))
+        factors = self.factors.get(symbol, np.ones(1))
+        keep = np.ones(len(days), dtype=bool)
+        if after is not None:
+            keep &= days > after
+        if until is not None:
+            keep &= days <= until
+        return [(int(days[i]), float(factors[i + 1] / factors[i])) for i in np.flatnonzero(keep)]
+
+    def factor(self, symbol, after_days, until_days):
+        """Quantity multiplier for symbol over the splits with after < day <= until, elementwise."""
+        after_days = np.asarray(after_days)
+        if symbol not in self.days:
+            return np.ones(np.broadcast(after_days, np.asarray(until_days)).shape)
+        days, factors = self.days[symbol], self.factors[symbol]
+        start = factors[np.searchsorted(days, after_days, side='right')]
+        end = factors[np.searchsorted(days, until_days, side='right')]
+        return np.where(np.asarray(until_days) > after_days, end / start, 1.0)
+
+    def adjust(self, lots, as_of_days, current_day):
+        """
+        Scale the quantities of lots (a LotTable) for the splits between each
+        lot's as-of day (as_of_days, one per lot or one for all) and
+        current_day, in place. Returns the factors.
+        """
+        factors = np.ones(len(lots))
+        as_of_days = np.broadcast_to(np.asarray(as_of_days, dtype=np.int64), (len(lots),))
+        for symbol in lots.held_symbols():
+            if symbol not in self.days:
+                continue
+            rows = lots.symbol_mask(symbol)
+            factors[rows] = self.factor(symbol, as_of_days[rows], current_day)
+        lots.qty = lots.qty * factors
+        return factors
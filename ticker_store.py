@@ -0,0 +1,209 @@
+"""
+Binary ticker store.
+
+Each symbol's close history lives in ticker_data/<SYM>.npy as a packed array of
+(int32 days since the epoch, float64 close) records sorted by day. Files are
+memory-mapped on load, so lookups binary-search the day column instead of
+parsing the whole history up front.
+
+Run this module once to migrate the legacy ticker_data/<SYM>.json files:
+
+    python ticker_store.py --delete-json
+"""
+import argparse
+import glob
+import json
+import os
+from collections.abc import MutableMapping
+
+import numpy as np
+
+
+TICKER_DIR = 'ticker_data'
+RECORD_DTYPE = np.dtype([('day', '<i4'), ('close', '<f8')])
+
+# Cached lookups take the close on the requested day or, for weekends and
+# holidays, the next trading day within this many calendar days.
+ASOF_LOOKAHEAD_DAYS = 5
+
+
+def iso_to_day(date_str):
+    """'YYYY-MM-DD' -> days since the epoch."""
+    return int(np.datetime64(date_str, 'D').astype(np.int64))
+
+
+def day_to_iso(day):
+    return str(np.datetime64(int(day), 'D'))
+
+
+def to_days(dates):
+    """Array of days since the epoch from 'YYYY-MM-DD' strings, datetimes, datetime64s or day numbers."""
+    dates = np.asarray(dates)
+    if dates.dtype.kind in 'iu' or dates.size == 0:
+        return dates.astype(np.int64)
+    return dates.astype('datetime64[D]').astype(np.int64)
+
+
+class PriceSeries(MutableMapping):
+    """
+    A symbol's close history keyed by 'YYYY-MM-DD' strings, backed by sorted
+    day/close arrays. Writes are buffered and merged into the arrays on the
+    next read, so filling in a freshly downloaded history stays cheap.
+    """
+
+    def __init__(self, days=None, closes=None):
+        self._days = np.asarray(days if days is not None else [], dtype=np.int32)
+        self._closes = np.asarray(closes if closes is not None else [], dtype=np.float64)
+        self._pending = {}
+
+    @classmethod
+    def from_dict(cls, data):
+        keys = sorted(data)
+        days = np.array(keys, dtype='datetime64[D]').astype(np.int32)
+        closes = np.array([data[k] for k in keys], dtype=np.float64)
+        return cls(days, closes)
+
+    @classmethod
+    def from_records(cls, records):
+        return cls(records['day'], records['close'])
+
+    def _consolidate(self):
+        if not self._pending:
+            return
+        new_days = np.fromiter(self._pending.keys(), dtype=np.int32, count=len(self._pending))
+        new_closes = np.fromiter(self._pending.values(), dtype=np.float64, count=len(self._pending))
+        days = np.concatenate([self._days, new_days])
+        closes = np.concatenate([self._closes, new_closes])
+        # Stable sort keeps pending values after the stored ones, so the last
+        # occurrence of a day is the newest write.
+        order = np.argsort(days, kind='stable')
+        days, closes = days[order], closes[order]
+        keep = np.append(days[1:] != days[:-1], True)
+        self._days, self._closes = days[keep], closes[keep]
+        self._pending = {}
+
+    @property
+    def days(self):
+        self._consolidate()
+        return self._days
+
+    @property
+    def closes(self):
+        self._consolidate()
+        return self._closes
+
+    def asof(self, day, lookahead=ASOF_LOOKAHEAD_DAYS):
+        """Close on `day` or the first trading day after it within `lookahead` days, else None."""
+        days = self.days
+        idx = int(np.searchsorted(days, day))
+        if idx < len(days) and days[idx] - day < lookahead:
+            return float(self._closes[idx])
+        return None
+
+    def asof_many(self, query_days, lookahead=ASOF_LOOKAHEAD_DAYS):
+        """Vectorized asof(); days with no close in the window come back as NaN."""
+        query_days = np.asarray(query_days, dtype=np.int64)
+        days = self.days
+        if len(days) == 0:
+            return np.full(query_days.shape, np.nan)
+        idx = np.searchsorted(days, query_days)
+        clipped = np.minimum(idx, len(days) - 1)
+        found = (idx < len(days)) & (days[clipped] - query_days < lookahead)
+        return np.where(found, self._closes[clipped], np.nan)
+
+    def _find(self, date_str):
+        day = iso_to_day(date_str)
+        days = self.days
+        idx = int(np.searchsorted(days, day))
+        if idx < len(days) and days[idx] == day:
+            return idx
+        return None
+
+    def __getitem__(self, date_str):
+        idx = self._find(date_str)
+        if idx is None:
+            raise KeyError(date_str)
+        return float(self._closes[idx])
+
+    def __contains__(self, date_str):
+        return self._find(date_str) is not None
+
+    def __setitem__(self, date_str, close):
+        self._pending[iso_to_day(date_str)] = float(close)
+
+    def __delitem__(self, date_str):
+        idx = self._find(date_str)
+        if idx is None:
+            raise KeyError(date_str)
+        self._days = np.delete(self._days, idx)
+        self._closes = np.delete(self._closes, idx)
+
+    def __iter__(self):
+        return (day_to_iso(d) for d in self.days)
+
+    def __len__(self):
+        return len(self.days)
+
+    def to_records(self):
+        records = np.empty(len(self.days), dtype=RECORD_DTYPE)
+        records['day'] = self._days
+        records['close'] = self._closes
+        return records
+
+
+def store_path(symbol, directory=TICKER_DIR):
+    return os.path.join(directory, f'{symbol}.npy')
+
+
+def load(symbol, directory=TICKER_DIR):
+    """Memory-map a symbol's history, falling back to a legacy JSON file. Returns None if neither exists."""
+    path = store_path(symbol, directory)
+    if os.path.exists(path):
+        return PriceSeries.from_records(np.load(path, mmap_mode='r'))
+    legacy_path = os.path.join(directory, f'{symbol}.json')
+    if os.path.exists(legacy_path):
+        with open(legacy_path, 'r') as fd:
+            return PriceSeries.from_dict(json.load(fd))
+    return None
+
+
+def save(symbol, series, directory=TICKER_DIR):
+    if not isinstance(series, PriceSeries):
+        series = PriceSeries.from_dict(series)
+    os.makedirs(directory, exist_ok=True)
+    path = store_path(symbol, directory)
+    # Write to a temp file and rename, so readers that still have the old
+    # file memory-mapped never see it truncated underneath them.
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as fd:
+        np.save(fd, series.to_records())
+    os.replace(tmp_path, path)
+
+
+def cached_symbols(directory=TICKER_DIR):
+    """Sorted symbols with a stored history (binary or legacy JSON) in directory."""
+    names = glob.glob(os.path.join(directory, '*.npy')) + glob.glob(os.path.join(directory, '*.json'))
+    return sorted({os.path.splitext(os.path.basename(name))[0] for name in names})
+
+
+def migrate_json(directory=TICKER_DIR, delete_json=False):
+    """Convert every legacy <SYM>.json in directory to the binary format."""
+    migrated = []
+    for json_path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+        symbol = os.path.splitext(os.path.basename(json_path))[0]
+        with open(json_path, 'r') as fd:
+            save(symbol, json.load(fd), directory)
+        if delete_json:
+            os.remove(json_path)
+        migrated.append(symbol)
+    return migrated
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Migrate ticker_data/*.json to the binary ticker store')
+    parser.add_argument('--directory', default=TICKER_DIR, help='Ticker cache directory')
+    parser.add_argument('--delete-json', action='store_true', help='Remove the JSON files after converting them')
+    args = parser.parse_args()
+
+    symbols = migrate_json(args.directory, args.delete_json)
+    print(f'Migrated {len(symbols)} symbols to {args.directory}/<SYM>.npy')
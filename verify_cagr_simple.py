@@ -153,26 +153,22 @@ def verify_stock_cagr(csv_files, symbol, current_date_str):
     print("=" * 100)
     return weighted_cagr
 
-if __name__ == '__main__':
-    import sys
-
-    # These should match the files in gains.py PATHS
-    csv_files = [
-        '/Users/osman/Downloads/PortfolioDownload_os_fidelity.csv',
-        '/Users/osman/Downloads/PortfolioDownload_ssr_fidelity.csv',
-        '/Users/osman/Downloads/PortfolioDownload_os_feb23.csv',
-        '/Users/osman/Downloads/PortfolioDownload_ssr_feb23.csv',
-        '/Users/osman/Downloads/Sellable_ssr_feb23.csv',
-        '/Users/osman/Downloads/chase_os_dec03.csv',
-    ]
-
+# These should match the files in gains.py PATHS
+CSV_FILES = [
+    '/Users/osman/Downloads/PortfolioDownload_os_fidelity.csv',
+    '/Users/osman/Downloads/PortfolioDownload_ssr_fidelity.csv',
+    '/Users/osman/Downloads/PortfolioDownload_os_feb23.csv',
+    '/Users/osman/Downloads/PortfolioDownload_ssr_feb23.csv',
+    '/Users/osman/Downloads/Sellable_ssr_feb23.csv',
+    '/Users/osman/Downloads/chase_os_dec03.csv',
+]
+
+
+def main(symbols=None, csv_files=CSV_FILES):
     current_date = most_recent_working_day()
 
     # Verify specific stocks
-    if len(sys.argv) > 1:
-        symbols = sys.argv[1:]
-    else:
-        symbols = ['NVDA']  # Default to NVDA
+    symbols = symbols or ['NVDA']  # Default to NVDA
 
     results = {}
     for symbol in symbols:
@@ -187,3 +183,10 @@ if __name__ == '__main__':
         print(f"{symbol:8s}: {cagr*100:6.2f}%")
     print("\n✅ VERIFICATION COMPLETE")
     print("\nTo verify other symbols, run: python verify_cagr_simple.py AAPL TSLA AMZN VGT")
+    return results
+
+
+if __name__ == '__main__':
+    import sys
+
+    main(sys.argv[1:])
@@ -42,23 +42,33 @@ PATHS = [
     '/Users/osman/Downloads/chase_os_sep02.csv',
 ]
 
-port = Portfolio()
+INDEXES = ['^GSPC', '^IXIC', '^DJI']
 
-if __name__ == '__main__':
-    for file_path in PATHS:
-        port.add_lots(port.parse_csv(file_path, fetch_AAPL_price=True))
 
-    symbols = set(['VGT', 'VTI', 'VOO', 'SPY', 'QQQ'])
-    for l in port.lots:
-        # print(f'{l.symbol} {l.date}')
-        symbols.add(l.symbol)
+def main(paths=PATHS, start_date='01/01/2019', end_date=None, index=INDEXES, frequency='daily', max_points=None):
+    port = Portfolio()
+    for file_path in paths:
+        lots, _ = port.parse_csv(file_path, None, fetch_AAPL_price=True)
+        port.add_lots(lots)
+
+    symbols = set(['VGT', 'VTI', 'VOO', 'SPY', 'QQQ']) | set(port.lots.held_symbols())
 
     for sym in symbols:
         port.cache_ticker_data(sym)
         print(f'Loaded data from cache for {sym}')
 
-    today = datetime.today().strftime('%m/%d/%Y')
-    port.generate_worm(index=['^GSPC', '^IXIC', '^DJI'], start_date='01/01/2019', end_date=today)
+    today = end_date or datetime.today().strftime('%m/%d/%Y')
+
+    # What if every purchase had gone into each cached ticker instead
+    ranked = port.rank_counterfactuals(port.counterfactual(start_date=start_date, end_date=today))
+    print(ranked.to_string(float_format=lambda v: f'{v:,.2f}'))
+
+    port.generate_worm(index=index, start_date=start_date, end_date=today, frequency=frequency,
+                       max_points=max_points)
     #port.generate_worm(index=['VTI', 'SPY', 'QQQ'], start_date='01/01/2019', end_date='08/29/2024')
     # port.generate_worm(index=['VGT'], start_date='01/01/2019')
     # port.generate_worm()
+
+
+if __name__ == '__main__':
+    main()